@@ -0,0 +1,268 @@
+"""
+Offline batch runner for directories of recordings and their Zoom transcripts.
+
+Reads a JSONL manifest with one recording per line:
+    {"id": "interview_01", "audio": "audio/interview_01.m4a", "transcript": "zoom/interview_01.txt",
+     "interviewee": "Jane Doe", "zoom_aligned": false, "profile": "standard"}
+
+Only "audio" is required, "id" defaults to the audio file name. Recordings are spread
+over a process pool with one model per worker. Every finished recording is written to
+the output directory and checkpointed in status.jsonl, so an interrupted run started
+again with the same output directory skips the recordings already done.
+
+Usage (model settings come from the same environment variables as the services):
+    python -m asr_inference_service.batch manifest.jsonl --output-dir results --workers 2
+"""
+
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from time import perf_counter
+
+import librosa
+
+from asr_inference_service.config import model_kwargs_from_env
+from asr_inference_service.profiles import DEFAULT_PROFILE
+
+logging.basicConfig(
+    format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO
+)
+
+STATUS_FILENAME = "status.jsonl"
+SUMMARY_FILENAME = "summary.json"
+
+# State of the worker process, the model is loaded once by init_worker
+WORKER_STATE = {}
+
+
+def read_manifest(manifest_path: str) -> list:
+    """Manifest items with ids, paths are resolved relative to the manifest"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    items = []
+
+    with open(manifest_path, encoding="utf-8") as manifest_file:
+        for line_number, line in enumerate(manifest_file, 1):
+            if not line.strip():
+                continue
+
+            item = json.loads(line)
+            if "audio" not in item:
+                raise ValueError(f"Manifest line {line_number} has no audio path.")
+
+            for key in ("audio", "transcript"):
+                if item.get(key):
+                    item[key] = os.path.join(base_dir, item[key])
+
+            item.setdefault("id", os.path.splitext(os.path.basename(item["audio"]))[0])
+            items.append(item)
+
+    ids = [item["id"] for item in items]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Manifest ids must be unique.")
+
+    return items
+
+
+def read_checkpoint(output_dir: str) -> dict:
+    """Latest checkpointed result per item id"""
+    status_path = os.path.join(output_dir, STATUS_FILENAME)
+    results = {}
+
+    if not os.path.exists(status_path):
+        return results
+
+    with open(status_path, encoding="utf-8") as status_file:
+        for line in status_file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a run killed while writing
+                continue
+            results[result["id"]] = result
+
+    return results
+
+
+def init_worker(model_kwargs: dict, stub_models: bool) -> None:
+    """Load one model copy in the worker process"""
+    if stub_models:
+        from asr_inference_service.stub import StubASRModel
+        WORKER_STATE["model"] = StubASRModel(
+            sample_rate=model_kwargs["sample_rate"],
+            timestamp_format=model_kwargs["timestamp_format"],
+            latency_per_second=float(os.environ.get("STUB_LATENCY_PER_SECOND", 0.01)),
+        )
+    else:
+        from asr_inference_service.model import ASRModelForInference
+        WORKER_STATE["model"] = ASRModelForInference(**model_kwargs)
+
+
+def transcribe_item(item: dict, output_dir: str) -> dict:
+    """Transcribe one manifest item in a worker, returns its checkpoint record"""
+    from asr_inference_service.transcription import run_transcription
+
+    item_start = perf_counter()
+    result = {"id": item["id"], "audio": item["audio"], "pid": os.getpid()}
+
+    try:
+        result["audio_seconds"] = librosa.get_duration(path=item["audio"])
+        transcription = run_transcription(
+            WORKER_STATE["model"],
+            item["audio"],
+            item.get("transcript"),
+            item.get("interviewee"),
+            item.get("zoom_aligned", False),
+            profile=item.get("profile", DEFAULT_PROFILE),
+        )
+
+        output_path = os.path.join(output_dir, f"{item['id']}.txt")
+        with open(f"{output_path}.tmp", "w", encoding="utf-8") as text_file:
+            text_file.write(transcription or "")
+        os.replace(f"{output_path}.tmp", output_path)
+
+        result.update(status="done", output=output_path)
+    except Exception as error:  # pylint: disable=broad-except
+        logging.exception("Item %s failed", item["id"])
+        result.update(status="failed", error=f"{type(error).__name__}: {error}")
+
+    result["elapsed"] = perf_counter() - item_start
+
+    return result
+
+
+class BatchRunner:
+    """Runs a manifest over a process pool and checkpoints every finished item"""
+
+    def __init__(self, output_dir: str, workers: int, model_kwargs: dict, stub_models: bool = False) -> None:
+        """
+        Inputs:
+            output_dir (str): directory of the transcriptions, status.jsonl and summary.json
+            workers (int): number of worker processes, each loads its own model
+            model_kwargs (dict): ASRModelForInference arguments
+            stub_models (bool): use stub models, to try the runner without weights
+        """
+        self.output_dir = output_dir
+        self.workers = max(workers, 1)
+        self.model_kwargs = model_kwargs
+        self.stub_models = stub_models
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def checkpoint(self, result: dict) -> None:
+        """Append a result to status.jsonl, flushed so it survives an interruption"""
+        with open(os.path.join(self.output_dir, STATUS_FILENAME), "a", encoding="utf-8") as status_file:
+            status_file.write(json.dumps(result) + "\n")
+            status_file.flush()
+            os.fsync(status_file.fileno())
+
+    def run(self, items: list, retry_failed: bool = True) -> dict:
+        """Method to transcribe the items not done yet
+
+        Inputs:
+            items (list): manifest items
+            retry_failed (bool): also run items that failed in a previous run
+
+        Returns:
+            summary (dict): see summarise
+        """
+        previous = read_checkpoint(self.output_dir)
+        skip_statuses = {"done"} if retry_failed else {"done", "failed"}
+        pending = [item for item in items if previous.get(item["id"], {}).get("status") not in skip_statuses]
+        logging.info(
+            "%s items in manifest, %s already checkpointed, %s to run on %s workers",
+            len(items),
+            len(items) - len(pending),
+            len(pending),
+            self.workers,
+        )
+
+        run_start = perf_counter()
+        results = []
+
+        if pending:
+            # spawn, CUDA cannot be used in forked workers
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(pending)),
+                mp_context=get_context("spawn"),
+                initializer=init_worker,
+                initargs=(self.model_kwargs, self.stub_models),
+            ) as executor:
+                futures = {executor.submit(transcribe_item, item, self.output_dir): item for item in pending}
+
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as error:
+                        # A worker died (e.g. out of memory), the item is retried on the next run
+                        logging.error("Worker died while processing %s: %s", futures[future]["id"], error)
+                        result = {"id": futures[future]["id"], "status": "failed", "error": "worker died"}
+
+                    self.checkpoint(result)
+                    results.append(result)
+                    logging.info(
+                        "[%s/%s] %s %s", len(results), len(pending), result["id"], result["status"]
+                    )
+
+        summary = self.summarise(items, results, perf_counter() - run_start)
+
+        with open(os.path.join(self.output_dir, SUMMARY_FILENAME), "w", encoding="utf-8") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+
+        return summary
+
+    @staticmethod
+    def summarise(items: list, results: list, elapsed: float) -> dict:
+        """Throughput and failures of this run, and the state of the whole manifest"""
+        done = [result for result in results if result["status"] == "done"]
+        failed = [result for result in results if result["status"] == "failed"]
+        audio_seconds = sum(result.get("audio_seconds", 0.0) for result in done)
+
+        return {
+            "manifest_items": len(items),
+            "run_items": len(results),
+            "done": len(done),
+            "failed": len(failed),
+            "elapsed": elapsed,
+            "audio_seconds": audio_seconds,
+            "items_per_hour": len(done) / elapsed * 3600 if elapsed else 0.0,
+            "audio_seconds_per_second": audio_seconds / elapsed if elapsed else 0.0,
+            "failures": [{"id": result["id"], "error": result.get("error")} for result in failed],
+        }
+
+
+def main():
+    """Run a manifest and log the summary"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="JSONL manifest of recordings")
+    parser.add_argument("--output-dir", default="batch_results", help="transcriptions and checkpoint directory")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("BATCH_WORKERS", 1)),
+                        help="worker processes, each with its own model copy")
+    parser.add_argument("--skip-failed", action="store_true", help="do not retry items that failed before")
+    parser.add_argument("--stub-models", action="store_true", help="use stub models (no weights, no GPU)")
+    args = parser.parse_args()
+
+    model_kwargs = {
+        "sample_rate": int(os.environ.get("SAMPLE_RATE", 16000)),
+        "timestamp_format": os.environ.get("TIMESTAMPS_FORMAT", "seconds"),
+    } if args.stub_models else model_kwargs_from_env()
+
+    runner = BatchRunner(args.output_dir, args.workers, model_kwargs, stub_models=args.stub_models)
+    summary = runner.run(read_manifest(args.manifest), retry_failed=not args.skip_failed)
+
+    logging.info(
+        "Batch done: %s done, %s failed in %.1fs, %.1f items/hour, %.2f audio seconds per second",
+        summary["done"],
+        summary["failed"],
+        summary["elapsed"],
+        summary["items_per_hour"],
+        summary["audio_seconds_per_second"],
+    )
+    for failure in summary["failures"]:
+        logging.warning("Failed: %s (%s)", failure["id"], failure["error"])
+
+
+if __name__ == "__main__":
+    main()
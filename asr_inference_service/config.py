@@ -0,0 +1,37 @@
+"""Model settings read from the environment variables shared by the services and CLIs"""
+
+import os
+
+
+def model_kwargs_from_env() -> dict:
+    """ASRModelForInference arguments from the environment variables of the services"""
+    return dict(
+        model_dir=os.environ["PRETRAINED_MODEL_DIR"],
+        sample_rate=int(os.environ["SAMPLE_RATE"]),
+        device=os.environ["DEVICE"],
+        timestamp_format=os.environ["TIMESTAMPS_FORMAT"],
+        min_segment_length=float(os.environ["MIN_SEGMENT_LENGTH"]),
+        min_silence_length=float(os.environ["MIN_SILENCE_LENGTH"]),
+        vad_trim=bool(int(os.environ.get("VAD_TRIM", 0))),
+        vad_threshold_db=float(os.environ.get("VAD_THRESHOLD_DB", -45.0)),
+        vad_floor_db=float(os.environ.get("VAD_FLOOR_DB", -60.0)),
+        vad_min_trim_length=float(os.environ.get("VAD_MIN_TRIM_LENGTH", 2.0)),
+        vad_padding=float(os.environ.get("VAD_PADDING", 0.25)),
+        diarization_profile=os.environ.get("DIARIZATION_PROFILE", "default"),
+        segmentation_step=float(os.environ["DIAR_SEGMENTATION_STEP"]) if os.environ.get("DIAR_SEGMENTATION_STEP") else None,
+        embedding_batch_size=int(os.environ["DIAR_EMBEDDING_BATCH_SIZE"]) if os.environ.get("DIAR_EMBEDDING_BATCH_SIZE") else None,
+        segmentation_batch_size=int(os.environ["DIAR_SEGMENTATION_BATCH_SIZE"]) if os.environ.get("DIAR_SEGMENTATION_BATCH_SIZE") else None,
+        optimized_runtime=bool(int(os.environ.get("OPTIMIZED_RUNTIME", 0))),
+        tokens_per_second=float(os.environ.get("TOKENS_PER_SECOND", 8.0)),
+        min_new_tokens=int(os.environ.get("MIN_NEW_TOKENS", 16)),
+        repetition_max_repeats=int(os.environ.get("REPETITION_MAX_REPEATS", 4)),
+        compression_ratio_threshold=float(os.environ.get("COMPRESSION_RATIO_THRESHOLD", 2.4)),
+        fallback_temperature=float(os.environ.get("FALLBACK_TEMPERATURE", 0.4)),
+        small_model_dir=os.environ.get("SMALL_MODEL_DIR") or None,
+        routing_max_duration=float(os.environ.get("ROUTING_MAX_DURATION", 3.0)),
+        routing_min_snr_db=float(os.environ.get("ROUTING_MIN_SNR_DB", 15.0)),
+        routing_min_confidence=float(os.environ.get("ROUTING_MIN_CONFIDENCE", -0.5)),
+        prefetch_batches=int(os.environ.get("PREFETCH_BATCHES", 2)),
+        precompute_features=bool(int(os.environ.get("PRECOMPUTE_FEATURES", 0))),
+        feature_chunk_seconds=float(os.environ.get("FEATURE_CHUNK_SECONDS", 300.0)),
+    )
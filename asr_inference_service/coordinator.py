@@ -0,0 +1,320 @@
+"""
+Coordinator that diarizes a recording once and shards the transcription of its
+segments across several ASR service instances (`/v1/transcribe`).
+
+Usage:
+    ASR_BACKENDS="http://localhost:8081,http://localhost:8082|4" \
+        python -m asr_inference_service.coordinator recording.wav
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, perf_counter, sleep
+from typing import List
+
+import numpy as np
+
+logging.basicConfig(
+    format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO
+)
+
+
+class Backend:
+    """State of one ASR service instance"""
+
+    def __init__(self, url: str, max_concurrency: int) -> None:
+        """
+        Inputs:
+            url (str): base url of the service, e.g. http://localhost:8080
+            max_concurrency (int): maximum number of requests in flight to this backend
+        """
+        self.url = url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.completed = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.average_latency = 0.0
+
+    @property
+    def load(self) -> float:
+        """Fraction of the concurrency limit in use"""
+        return self.in_flight / self.max_concurrency
+
+    def is_open(self, now: float) -> bool:
+        """Whether the circuit breaker keeps the backend out of rotation"""
+        return self.open_until > now
+
+    def record(self, latency: float) -> None:
+        """Keep an exponential moving average of the request latency"""
+        self.completed += 1
+        self.average_latency = (
+            latency if self.completed == 1 else 0.8 * self.average_latency + 0.2 * latency
+        )
+
+
+def parse_backends(backends: str, default_concurrency: int) -> List[Backend]:
+    """
+    Parse a comma separated list of backends, every backend can set its own
+    concurrency limit with a `|` suffix. E.g.
+
+    "http://node1:8080|4,http://node2:8080"
+    """
+    parsed = []
+
+    for backend in map(str.strip, backends.split(",")):
+        if not backend:
+            continue
+
+        url, _, concurrency = backend.partition("|")
+        parsed.append(Backend(url, int(concurrency) if concurrency else default_concurrency))
+
+    return parsed
+
+
+class ShardingCoordinator:
+    """Diarizes locally and transcribes the segments on remote ASR services"""
+
+    def __init__(self,
+                 backends: List[Backend],
+                 diarizer,
+                 sample_rate: int = 16000,
+                 timestamp_format: str = 'seconds',
+                 retries: int = 3,
+                 timeout: float = 600.0,
+                 failure_threshold: int = 3,
+                 cooldown: float = 30.0) -> None:
+        """
+        Inputs:
+            backends (list): the ASR service instances to send segments to
+            diarizer: object with a diarize(filepath, **hints) method (e.g. PyannoteDiarizer)
+            sample_rate (int): sample rate the segments are sent at
+            timestamp_format (str): 'seconds' or 'minutes'
+            retries (int): attempts per segment before the job fails
+            timeout (float): timeout in seconds of a single request
+            failure_threshold (int): consecutive failures after which a backend is taken out
+                of rotation for the cooldown
+            cooldown (float): seconds a failing backend is skipped, a failure on its first
+                request after the cooldown takes it out again
+        """
+        if not backends:
+            raise ValueError("No ASR backends configured.")
+
+        self.backends = backends
+        self.diarizer = diarizer
+        self.target_sr = sample_rate
+        self.timestamp_format = timestamp_format if timestamp_format in ['minutes', 'seconds'] else 'seconds'
+        self.retries = retries
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.condition = threading.Condition()
+
+        logging.info(
+            "Coordinator backends: %s",
+            [(backend.url, backend.max_concurrency) for backend in self.backends],
+        )
+
+    def acquire_backend(self, excluded: set) -> Backend:
+        """Method to block until a backend has a free slot and reserve it. Backends with an
+        open circuit breaker are skipped, the least loaded of the others wins and ties are
+        broken by the fewest failures, then the lowest average latency.
+
+        Inputs:
+            excluded (set): urls of backends that already failed for this segment, only used
+                when every other backend is excluded as well
+        """
+        with self.condition:
+            while True:
+                now = monotonic()
+                candidates = [
+                    backend for backend in self.backends
+                    if backend.in_flight < backend.max_concurrency and not backend.is_open(now)
+                ]
+                preferred = [backend for backend in candidates if backend.url not in excluded]
+                candidates = preferred or candidates
+
+                if candidates:
+                    backend = min(
+                        candidates,
+                        key=lambda backend: (backend.load, backend.failures, backend.average_latency),
+                    )
+                    backend.in_flight += 1
+                    return backend
+
+                # Wake up when the first breaker closes, or when a slot is released
+                reopen = [backend.open_until - now for backend in self.backends if backend.is_open(now)]
+                self.condition.wait(timeout=min(reopen) if reopen else None)
+
+    def release_backend(self, backend: Backend, latency: float = None) -> None:
+        """Method to free the slot reserved by acquire_backend and record the outcome
+
+        Inputs:
+            backend (Backend): backend the request was sent to
+            latency (float): seconds the request took, None if it failed
+        """
+        with self.condition:
+            backend.in_flight -= 1
+
+            if latency is not None:
+                backend.record(latency)
+                backend.consecutive_failures = 0
+            else:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+
+                if backend.consecutive_failures >= self.failure_threshold:
+                    backend.open_until = monotonic() + self.cooldown
+                    logging.warning(
+                        "Backend %s failed %s times in a row, skipped for %ss",
+                        backend.url,
+                        backend.consecutive_failures,
+                        self.cooldown,
+                    )
+
+            self.condition.notify_all()
+
+    def request_transcription(self, backend: Backend, waveform: np.ndarray) -> str:
+        """Method to send one segment to the /v1/transcribe endpoint of a backend"""
+        request = urllib.request.Request(
+            f"{backend.url}/v1/transcribe",
+            data=json.dumps({"array": waveform.tolist()}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())["transcription"]
+
+    def transcribe_segment(self, waveform: np.ndarray) -> str:
+        """Method to transcribe one segment, retrying on another backend on failure"""
+        excluded = set()
+
+        for attempt in range(self.retries):
+            backend = self.acquire_backend(excluded)
+            request_start = perf_counter()
+
+            try:
+                transcription = self.request_transcription(backend, waveform)
+            except Exception as error:
+                excluded.add(backend.url)
+                logging.warning(
+                    "Backend %s failed (attempt %s of %s): %s",
+                    backend.url,
+                    attempt + 1,
+                    self.retries,
+                    error,
+                )
+                self.release_backend(backend)
+
+                if attempt + 1 < self.retries:
+                    sleep(0.5 * 2**attempt)
+                continue
+
+            self.release_backend(backend, perf_counter() - request_start)
+
+            return transcription
+
+        raise RuntimeError(f"Segment failed on every attempt ({self.retries}).")
+
+    def diar_inference(self, filepath: str, **hints) -> str:
+        """Method to diarize once and transcribe the segments on the backends, the
+        transcription is reassembled in the original segment order
+
+        Inputs:
+            filepath (str): path to the audio file
+            hints: speaker count hints passed to the diarizer
+
+        Returns:
+            final_transcription (str): transcription with timestamps attached to it
+        """
+        # Loaded here so the scheduling logic imports without the audio and model stack
+        import librosa
+
+        from asr_inference_service.model import format_segments
+
+        coordinator_start = perf_counter()
+
+        segments = self.diarizer.diarize(filepath, **hints).reset_index(drop=True)
+        waveform, _ = librosa.load(filepath, sr=self.target_sr, mono=True)
+
+        split_audios = [
+            waveform[int(start * self.target_sr):int(end * self.target_sr)]
+            for start, end in zip(segments["start_time"], segments["end_time"])
+        ]
+        total_concurrency = sum(backend.max_concurrency for backend in self.backends)
+
+        # Threads only wait on HTTP, backends enforce the concurrency limits
+        with ThreadPoolExecutor(max_workers=max(total_concurrency, 1)) as executor:
+            segments["text"] = list(executor.map(self.transcribe_segment, split_audios))
+
+        coordinator_end = perf_counter()
+        logging.info(
+            "Coordinator transcribed %s segments. Elapsed time: %s",
+            len(segments),
+            coordinator_end - coordinator_start,
+        )
+        for backend in self.backends:
+            logging.info(
+                "Backend %s: %s segments, %s failures, average latency %.3fs",
+                backend.url,
+                backend.completed,
+                backend.failures,
+                backend.average_latency,
+            )
+
+        return format_segments(segments, self.timestamp_format)
+
+
+def main():
+    """Transcribe one recording across the configured backends"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("audio_filepath", help="recording to transcribe")
+    parser.add_argument("--output", help="write the transcription to this file instead of stdout")
+    parser.add_argument("--num-speakers", type=int, default=None, help="speaker count hint for diarization")
+    parser.add_argument("--stub-diarizer", action="store_true", help="use fixed length turns instead of pyannote")
+    args = parser.parse_args()
+
+    backends = parse_backends(
+        os.environ["ASR_BACKENDS"], int(os.environ.get("BACKEND_MAX_CONCURRENCY", 2))
+    )
+
+    if args.stub_diarizer:
+        from asr_inference_service.stub import StubDiarizer
+        diarizer = StubDiarizer()
+    else:
+        from asr_inference_service.diarizer import PyannoteDiarizer
+        diarizer = PyannoteDiarizer(
+            device=os.environ.get("DEVICE", "cpu"),
+            min_segment_length=float(os.environ.get("MIN_SEGMENT_LENGTH", 0.5)),
+            min_silence_length=float(os.environ.get("MIN_SILENCE_LENGTH", 0)),
+            profile=os.environ.get("DIARIZATION_PROFILE", "default"),
+        )
+
+    coordinator = ShardingCoordinator(
+        backends,
+        diarizer,
+        sample_rate=int(os.environ.get("SAMPLE_RATE", 16000)),
+        timestamp_format=os.environ.get("TIMESTAMPS_FORMAT", "seconds"),
+        retries=int(os.environ.get("BACKEND_RETRIES", 3)),
+        timeout=float(os.environ.get("BACKEND_TIMEOUT", 600)),
+        failure_threshold=int(os.environ.get("BACKEND_FAILURE_THRESHOLD", 3)),
+        cooldown=float(os.environ.get("BACKEND_COOLDOWN", 30)),
+    )
+    transcription = coordinator.diar_inference(args.audio_filepath, num_speakers=args.num_speakers)
+
+    if args.output:
+        with open(args.output, "w") as text_file:
+            text_file.write(transcription)
+    else:
+        print(transcription)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,47 @@
 
-from typing import List, Union
+import threading
+from collections import Counter
+from time import perf_counter
+from typing import Callable, List, Optional, Tuple, Union
 from pyannote.audio import Pipeline
 
 import logging
+import librosa
+import numpy as np
 import torch
 import pandas as pd
 
+from asr_inference_service.vad import EnergyVAD
+
 logger_nemo = logging.getLogger('nemo_logger')
 logger_nemo.disabled = True
 
+DIARIZATION_SAMPLE_RATE = 16000
+
+# Pipeline hyperparameters per profile, "fast" trades some accuracy for speed on CPU nodes
+DIARIZATION_PROFILES = {
+    'default': {},
+    'fast': {
+        'segmentation_step': 0.5,
+        'embedding_batch_size': 32,
+        'segmentation_batch_size': 32,
+    },
+}
+
 class PyannoteDiarizer:
     
     def __init__(self, device: str,
                  min_segment_length: float,
-                 min_silence_length: float):
+                 min_silence_length: float,
+                 vad: Optional[EnergyVAD] = None,
+                 profile: str = 'default',
+                 segmentation_step: Optional[float] = None,
+                 embedding_batch_size: Optional[int] = None,
+                 segmentation_batch_size: Optional[int] = None):
+        '''
+        segmentation_step, embedding_batch_size and segmentation_batch_size override
+        the values of the chosen profile (see DIARIZATION_PROFILES)
+        '''
         
         device = device if device in ['cuda', 'cpu'] else 'cuda' if torch.cuda.is_available() else 'cpu'
         self.device = torch.device(device)
@@ -24,12 +52,143 @@ class PyannoteDiarizer:
         
         self.min_silence_length = min_silence_length
         logging.info("Minimum Silence Length: %s", self.min_silence_length)
+        
+        self.vad = vad
+        logging.info("VAD trimming before diarization: %s", self.vad is not None)
+
+        # Pipeline runs, seconds trimmed by the VAD and diarization time, read by
+        # asr_inference_service.evaluation to relate the time saved to the trimmed fraction
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
 
         self.diarizer = Pipeline.from_pretrained("pyannote/speaker-diarization-3.1").to(self.device)
 
         logging.info("Pyannote model loaded!")
         
-    def diarize_into_string(self, audio_filepath: str) -> str:
+        profile = profile if profile in DIARIZATION_PROFILES else 'default'
+        settings = dict(DIARIZATION_PROFILES[profile])
+        overrides = {
+            'segmentation_step': segmentation_step,
+            'embedding_batch_size': embedding_batch_size,
+            'segmentation_batch_size': segmentation_batch_size,
+        }
+        settings.update({key: value for key, value in overrides.items() if value is not None})
+        self.apply_settings(**settings)
+        logging.info("Diarization profile: %s %s", profile, settings)
+    
+    def apply_settings(self,
+                       segmentation_step: Optional[float] = None,
+                       embedding_batch_size: Optional[int] = None,
+                       segmentation_batch_size: Optional[int] = None):
+        '''
+        Set the speed related hyperparameters of the pyannote pipeline.
+        
+        segmentation_step is a ratio of the segmentation window duration,
+        larger steps mean less overlap between windows and fewer forward passes.
+        '''
+        
+        if segmentation_step is not None:
+            self.diarizer.segmentation_step = segmentation_step
+            self.diarizer._segmentation.step = segmentation_step * self.diarizer._segmentation.duration
+            
+        if embedding_batch_size is not None:
+            self.diarizer.embedding_batch_size = embedding_batch_size
+            
+        if segmentation_batch_size is not None:
+            self.diarizer.segmentation_batch_size = segmentation_batch_size
+    
+    def run_pipeline(self, audio_filepath: Union[str, np.ndarray],
+                     num_speakers: Optional[int] = None,
+                     min_speakers: Optional[int] = None,
+                     max_speakers: Optional[int] = None,
+                     hook: Optional[Callable] = None) -> List[Tuple[float, float, str]]:
+        '''
+        Run the pyannote pipeline on audio_filepath and return (start, end, speaker) turns.
+        audio_filepath can also be an already decoded 16kHz mono waveform.
+        
+        If a VAD is set, long non-speech spans are removed before diarization and the
+        turns are mapped back to the original timeline.
+        
+        num_speakers, min_speakers and max_speakers are passed to the pipeline as hints
+        for clustering (e.g. from the participants of a Zoom transcript).
+        
+        hook is called by the pipeline after every step with
+        (step_name, step_artefact, file=None, total=None, completed=None), raising in it
+        aborts diarization.
+        '''
+        
+        diarization_start = perf_counter()
+        hints = {
+            'num_speakers': num_speakers,
+            'min_speakers': min_speakers,
+            'max_speakers': max_speakers,
+        }
+        hints = {key: value for key, value in hints.items() if value}
+        
+        if hints:
+            logging.info("Diarization speaker hints: %s", hints)
+        
+        if self.vad is None:
+            if isinstance(audio_filepath, np.ndarray):
+                audio_filepath = {
+                    "waveform": torch.from_numpy(audio_filepath.astype(np.float32))[None],
+                    "sample_rate": DIARIZATION_SAMPLE_RATE,
+                }
+            diarization = self.diarizer(audio_filepath, hook=hook, **hints)
+            self.record_run(diarization_start)
+            return [(turn.start, turn.end, speaker) 
+                    for turn, _, speaker in diarization.itertracks(yield_label=True)]
+        
+        if isinstance(audio_filepath, np.ndarray):
+            waveform, sample_rate = audio_filepath.astype(np.float32), DIARIZATION_SAMPLE_RATE
+        else:
+            waveform, sample_rate = librosa.load(audio_filepath, sr=DIARIZATION_SAMPLE_RATE, mono=True)
+        regions = self.vad.speech_regions(waveform, sample_rate)
+        compacted = self.vad.compact(waveform, regions)
+        
+        total_length = len(waveform) / sample_rate
+        kept_length = len(compacted) / sample_rate
+        
+        if kept_length == 0:
+            logging.info("No speech found by VAD, skipping diarization")
+            self.record_run(diarization_start, total_length)
+            return []
+        
+        diarization = self.diarizer(
+            {"waveform": torch.from_numpy(compacted)[None], "sample_rate": sample_rate},
+            hook=hook,
+            **hints,
+        )
+        turns = [(turn.start, turn.end, speaker) 
+                 for turn, _, speaker in diarization.itertracks(yield_label=True)]
+        
+        # Time saved is not extrapolated from the trimmed fraction, clustering does not scale
+        # linearly. asr_inference_service.evaluation measures it against the baseline
+        elapsed = self.record_run(diarization_start, total_length - kept_length)
+        logging.info(
+            "VAD trimmed %.1f%% of audio (%.2fs of %.2fs). Diarization elapsed time: %s",
+            (1 - kept_length / total_length) * 100,
+            total_length - kept_length,
+            total_length,
+            elapsed,
+        )
+        
+        return self.vad.restore_timestamps(turns, regions, sample_rate)
+        
+    def record_run(self, diarization_start: float, trimmed_seconds: float = 0.0) -> float:
+        '''
+        Add a pipeline run to stats and return its elapsed time.
+        '''
+
+        elapsed = perf_counter() - diarization_start
+        with self.stats_lock:
+            self.stats['runs'] += 1
+            self.stats['trimmed_seconds'] += trimmed_seconds
+            self.stats['elapsed'] += elapsed
+
+        return elapsed
+
+    def diarize_into_string(self, audio_filepath: Union[str, np.ndarray], hook: Optional[Callable] = None, **hints) -> str:
         '''
         Diarize from audio_filepath to string with format:
         
@@ -37,15 +196,14 @@ class PyannoteDiarizer:
         '''
 
         logging.info("Diarization started")
-        diarization = self.diarizer(audio_filepath)
         simple_text = ''
 
-        for turn, _, cur_speaker in diarization.itertracks(yield_label=True):
-            simple_text += f"start={turn.start:.3f}s stop={turn.end:.3f}s speaker_{cur_speaker} \n"
+        for start, end, cur_speaker in self.run_pipeline(audio_filepath, hook=hook, **hints):
+            simple_text += f"start={start:.3f}s stop={end:.3f}s speaker_{cur_speaker} \n"
                 
         return simple_text
     
-    def diarize(self, audio_filepath: str) -> pd.DataFrame:
+    def diarize(self, audio_filepath: Union[str, np.ndarray], hook: Optional[Callable] = None, **hints) -> pd.DataFrame:
         ''' 
         Diarize from audio_filepath to pandas dataframe with format:
         
@@ -53,13 +211,12 @@ class PyannoteDiarizer:
         '''
 
         logging.info("Diarization started")
-        diarization = self.diarizer(audio_filepath)
         df = pd.DataFrame(columns=['start_time', 'end_time', 'speaker', 'text'])
         prev_speaker = 'None'
 
-        for turn, _, speaker in diarization.itertracks(yield_label=True):
+        for start, end, speaker in self.run_pipeline(audio_filepath, hook=hook, **hints):
             
-            start_time, stop_time, cur_speaker = round(turn.start, 3), round(turn.end, 3), speaker
+            start_time, stop_time, cur_speaker = round(start, 3), round(end, 3), speaker
             duration = stop_time-start_time
             
             if duration < self.min_segment_length:
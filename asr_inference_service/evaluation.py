@@ -0,0 +1,438 @@
+"""
+Offline accuracy-vs-speed evaluation of the transcription configurations.
+
+Runs every configuration on a local reference set and reports WER, DER, Zoom-name
+attribution accuracy, runtime and real-time factor (RTF), with a Pareto table of the
+configurations. The reference set is a JSONL manifest, one recording per line (paths
+are relative to the manifest):
+    {"id": "interview_01", "audio": "audio/interview_01.wav", "reference_transcript": "ref/interview_01.txt",
+     "reference_rttm": "ref/interview_01.rttm", "zoom_transcript": "zoom/interview_01.txt"}
+
+The reference RTTM speakers must use the participant names of the Zoom transcripts for
+the attribution accuracy. Models are loaded from the local directories of the usual
+environment variables, with the Hugging Face hub offline.
+
+Usage:
+    python -m asr_inference_service.evaluation reference.jsonl --output evaluation.json
+    python -m asr_inference_service.evaluation reference.jsonl --configs configs.json
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import re
+import string
+from time import perf_counter
+
+# Reference runs must not reach the network, models come from the local cache
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import librosa
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from asr_inference_service.config import model_kwargs_from_env
+from asr_inference_service.profiles import DEFAULT_PROFILE
+from utils.utils import (
+    convert_list_of_timestamps_to_seconds,
+    get_most_frequent_speaker,
+    get_timestamps_for_speaker,
+    get_zoom_cues,
+)
+
+logging.basicConfig(
+    format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO
+)
+
+# Configuration name to ASRModelForInference overrides, plus the run options
+# "profile" (decoding profile) and "zoom_aligned" (Zoom timings instead of pyannote)
+EVALUATION_CONFIGS = {
+    "baseline": {},
+    "vad_trim": {"vad_trim": True},
+    "fast_diarization": {"diarization_profile": "fast"},
+    "precomputed_features": {"precompute_features": True},
+    "draft": {"profile": "draft"},
+    "archival": {"profile": "archival"},
+    "zoom_aligned": {"zoom_aligned": True},
+}
+
+RUN_OPTIONS = ("profile", "zoom_aligned")
+
+SEGMENT_PATTERN = re.compile(r"^\[(\d+\.\d+) - (\d+\.\d+)\] \[(.+?)\] : (.*)$", re.MULTILINE)
+
+# Frame resolution of the DER computation in seconds
+DER_RESOLUTION = 0.01
+
+# SPEAKER lines of an RTTM file have at least this many fields, the 8th is the speaker
+RTTM_MIN_FIELDS = 8
+
+
+def normalise_text(text: str) -> list:
+    """Lowercased words without punctuation (apostrophes kept)"""
+    text = text.lower().translate(str.maketrans("", "", string.punctuation.replace("'", "")))
+
+    return text.split()
+
+
+def word_errors(reference: list, hypothesis: list) -> int:
+    """Word level edit distance, one DP row at a time vectorised with numpy"""
+    vocabulary = {word: idx for idx, word in enumerate(set(reference) | set(hypothesis))}
+    hypothesis_ids = np.array([vocabulary[word] for word in hypothesis], dtype=np.int64)
+    row = np.arange(len(hypothesis) + 1)
+
+    for ref_idx, word in enumerate(reference, 1):
+        substitution = row[:-1] + (hypothesis_ids != vocabulary[word])
+        candidates = np.concatenate(([ref_idx], np.minimum(substitution, row[1:] + 1)))
+        # Insertions: row[j] = min over k <= j of candidates[k] + (j - k)
+        positions = np.arange(len(candidates))
+        row = np.minimum.accumulate(candidates - positions) + positions
+
+    return int(row[-1])
+
+
+def read_rttm(rttm_path: str) -> list:
+    """Reference turns of an RTTM file as (start, end, speaker)"""
+    turns = []
+
+    with open(rttm_path, encoding="utf-8") as rttm_file:
+        for line in rttm_file:
+            fields = line.split()
+            if len(fields) >= RTTM_MIN_FIELDS and fields[0] == "SPEAKER":
+                start, duration = float(fields[3]), float(fields[4])
+                turns.append((start, start + duration, fields[7]))
+
+    return turns
+
+
+def parse_transcription(transcription: str, timestamp_format: str = 'seconds') -> list:
+    """Segments of a formatted transcription as (start, end, speaker, text), in seconds"""
+    scale = 60.0 if timestamp_format == 'minutes' else 1.0
+
+    return [
+        (float(start) * scale, float(end) * scale, speaker, text)
+        for start, end, speaker, text in SEGMENT_PATTERN.findall(transcription or "")
+    ]
+
+
+def speaker_frames(turns: list, num_frames: int) -> tuple:
+    """Boolean activity matrix (speakers, frames) of speaker turns and the speaker labels"""
+    labels = sorted({speaker for _, _, speaker in turns})
+    activity = np.zeros((len(labels), num_frames), dtype=bool)
+
+    for start, end, speaker in turns:
+        activity[labels.index(speaker), int(start / DER_RESOLUTION):int(end / DER_RESOLUTION)] = True
+
+    return activity, labels
+
+
+def diarization_error(reference: list, hypothesis: list) -> dict:
+    """Frame based diarization error (no collar, overlapping speech counted per speaker)
+    with the optimal one-to-one mapping of hypothesis to reference speakers
+
+    Returns:
+        errors (dict): 'missed', 'false_alarm', 'confusion' and 'total' reference speech in seconds
+    """
+    duration = max([end for _, end, _ in reference + hypothesis], default=0.0)
+    num_frames = int(np.ceil(duration / DER_RESOLUTION)) + 1
+    ref_activity, _ = speaker_frames(reference, num_frames)
+    hyp_activity, _ = speaker_frames(hypothesis, num_frames)
+
+    ref_count = ref_activity.sum(axis=0)
+    hyp_count = hyp_activity.sum(axis=0)
+
+    matched = np.zeros(num_frames)
+    if len(ref_activity) and len(hyp_activity):
+        overlap = ref_activity.astype(np.float32) @ hyp_activity.T.astype(np.float32)
+        ref_idx, hyp_idx = linear_sum_assignment(-overlap)
+        matched = (ref_activity[ref_idx] & hyp_activity[hyp_idx]).sum(axis=0)
+
+    return {
+        "missed": float(np.maximum(ref_count - hyp_count, 0).sum() * DER_RESOLUTION),
+        "false_alarm": float(np.maximum(hyp_count - ref_count, 0).sum() * DER_RESOLUTION),
+        "confusion": float((np.minimum(ref_count, hyp_count) - matched).sum() * DER_RESOLUTION),
+        "total": float(ref_count.sum() * DER_RESOLUTION),
+    }
+
+
+def attribute_zoom_names(segments: list, zoom_transcript: str) -> list:
+    """Replace diarization labels (e.g. SPEAKER_00) with Zoom participant names through the
+    app's mapping (get_most_frequent_speaker): the midpoint of every Zoom utterance votes
+    for the label of the segment it falls in. Segments already labelled with Zoom names
+    (Zoom-aligned runs) are kept"""
+    names = {speaker for _, _, speaker in get_zoom_cues(zoom_transcript)}
+    mapping = get_most_frequent_speaker(
+        [[start, end, speaker] for start, end, speaker, _ in segments if speaker not in names],
+        convert_list_of_timestamps_to_seconds(get_timestamps_for_speaker(zoom_transcript)),
+    )
+
+    return [(start, end, mapping.get(speaker, speaker), text) for start, end, speaker, text in segments]
+
+
+def attribution_seconds(segments: list, reference: list) -> tuple:
+    """Seconds of the segments whose speaker name matches the reference speakers at that time,
+    and the total seconds of the segments"""
+    correct = 0.0
+
+    for start, end, speaker, _ in segments:
+        for ref_start, ref_end, ref_speaker in reference:
+            if ref_speaker == speaker:
+                correct += max(min(end, ref_end) - max(start, ref_start), 0.0)
+
+    return correct, sum(end - start for start, end, _, _ in segments)
+
+
+def pareto_front(rows: list, objectives: tuple = ("rtf", "wer", "der")) -> set:
+    """Names of the configurations not dominated on the objectives (lower is better)"""
+    front = set()
+
+    for row in rows:
+        values = [row[key] for key in objectives]
+        dominated = any(
+            all(other[key] <= value for key, value in zip(objectives, values))
+            and any(other[key] < value for key, value in zip(objectives, values))
+            for other in rows
+            if other is not row
+        )
+        if not dominated:
+            front.add(row["config"])
+
+    return front
+
+
+def diarization_time_saved(rows: list, baseline: str = "baseline") -> None:
+    """Fraction of the baseline diarization time saved by every configuration, per item and
+    overall, set in place next to the trimmed fraction. None without a baseline run or
+    when a configuration does not diarize (Zoom-aligned)"""
+    reference = next((row for row in rows if row["config"] == baseline), None)
+    reference_items = {item["id"]: item for item in reference["items"]} if reference else {}
+
+    def saved(diarization_time, baseline_time):
+        return 1 - diarization_time / baseline_time if baseline_time and diarization_time else None
+
+    for row in rows:
+        row["diarization_time_saved"] = saved(
+            row["diarization_time"], reference["diarization_time"] if reference else None
+        )
+        for item in row["items"]:
+            baseline_item = reference_items.get(item["id"], {})
+            item["diarization_time_saved"] = saved(item["diarization_time"], baseline_item.get("diarization_time"))
+
+        if row["diarization_time_saved"] is not None and row["trimmed_fraction"]:
+            logging.info(
+                "%s: VAD trimmed %.1f%% of audio, diarization time saved: %.1f%%",
+                row["config"],
+                row["trimmed_fraction"] * 100,
+                row["diarization_time_saved"] * 100,
+            )
+
+
+class Evaluator:
+    """Runs the configurations on the reference set and scores them"""
+
+    def __init__(self, items: list, configs: dict, base_model_kwargs: dict) -> None:
+        """
+        Inputs:
+            items (list): reference set items (see module docstring)
+            configs (dict): configuration name to model overrides and run options
+            base_model_kwargs (dict): ASRModelForInference arguments shared by every configuration
+        """
+        self.items = items
+        self.configs = configs
+        self.base_model_kwargs = base_model_kwargs
+        self.model = None
+        self.model_key = None
+
+    def load_model(self, overrides: dict):
+        """Method to load the model of a configuration, reused by consecutive configurations
+        with the same model overrides"""
+        from asr_inference_service.model import ASRModelForInference
+
+        model_key = json.dumps(overrides, sort_keys=True)
+        if model_key != self.model_key:
+            self.model = None
+            gc.collect()
+            self.model = ASRModelForInference(**{**self.base_model_kwargs, **overrides})
+            self.model_key = model_key
+
+        return self.model
+
+    def run_config(self, name: str, config: dict) -> dict:
+        """Method to run one configuration on every item and aggregate its scores"""
+        from asr_inference_service.transcription import run_transcription
+
+        overrides = {key: value for key, value in config.items() if key not in RUN_OPTIONS}
+        model = self.load_model(overrides)
+        totals = {
+            "errors": 0, "reference_words": 0, "der_errors": 0.0, "der_total": 0.0,
+            "attributed": 0.0, "attribution_total": 0.0, "runtime": 0.0, "audio_seconds": 0.0,
+            "diarization_time": 0.0, "trimmed_seconds": 0.0,
+        }
+        item_results = []
+
+        for item in self.items:
+            if config.get("zoom_aligned") and not item.get("zoom_transcript"):
+                logging.info("Skipping %s for %s, it has no Zoom transcript", item["id"], name)
+                continue
+
+            audio_seconds = librosa.get_duration(path=item["audio"])
+            diarization_stats = dict(model.diar_model.stats)
+            run_start = perf_counter()
+            transcription = run_transcription(
+                model,
+                item["audio"],
+                item.get("zoom_transcript"),
+                zoom_aligned=config.get("zoom_aligned", False),
+                profile=config.get("profile", DEFAULT_PROFILE),
+            )
+            runtime = perf_counter() - run_start
+
+            segments = parse_transcription(transcription, model.timestamp_format)
+            result = {"id": item["id"], "runtime": runtime, "rtf": runtime / audio_seconds}
+            totals["runtime"] += runtime
+            totals["audio_seconds"] += audio_seconds
+
+            # Diarization time and VAD trimmed seconds of this item only
+            diarization_time = model.diar_model.stats["elapsed"] - diarization_stats.get("elapsed", 0.0)
+            trimmed_seconds = model.diar_model.stats["trimmed_seconds"] - diarization_stats.get("trimmed_seconds", 0.0)
+            result["diarization_time"] = diarization_time
+            result["trimmed_fraction"] = trimmed_seconds / audio_seconds
+            totals["diarization_time"] += diarization_time
+            totals["trimmed_seconds"] += trimmed_seconds
+
+            if item.get("reference_transcript"):
+                with open(item["reference_transcript"], encoding="utf-8") as reference_file:
+                    reference_words = normalise_text(reference_file.read())
+                hypothesis_words = normalise_text(" ".join(text for _, _, _, text in segments))
+                errors = word_errors(reference_words, hypothesis_words)
+                result["wer"] = errors / max(len(reference_words), 1)
+                totals["errors"] += errors
+                totals["reference_words"] += len(reference_words)
+
+            if item.get("reference_rttm"):
+                reference_turns = read_rttm(item["reference_rttm"])
+                der = diarization_error(
+                    reference_turns, [(start, end, speaker) for start, end, speaker, _ in segments]
+                )
+                result["der"] = (der["missed"] + der["false_alarm"] + der["confusion"]) / max(der["total"], 1e-9)
+                totals["der_errors"] += der["missed"] + der["false_alarm"] + der["confusion"]
+                totals["der_total"] += der["total"]
+
+                if item.get("zoom_transcript"):
+                    named_segments = attribute_zoom_names(segments, item["zoom_transcript"])
+                    correct, total = attribution_seconds(named_segments, reference_turns)
+                    result["attribution_accuracy"] = correct / max(total, 1e-9)
+                    totals["attributed"] += correct
+                    totals["attribution_total"] += total
+
+            logging.info("%s / %s: %s", name, item["id"], result)
+            item_results.append(result)
+
+        return {
+            "config": name,
+            "settings": config,
+            "wer": totals["errors"] / totals["reference_words"] if totals["reference_words"] else None,
+            "der": totals["der_errors"] / totals["der_total"] if totals["der_total"] else None,
+            "attribution_accuracy": (
+                totals["attributed"] / totals["attribution_total"] if totals["attribution_total"] else None
+            ),
+            "runtime": totals["runtime"],
+            "rtf": totals["runtime"] / totals["audio_seconds"] if totals["audio_seconds"] else None,
+            "diarization_time": totals["diarization_time"],
+            "trimmed_fraction": (
+                totals["trimmed_seconds"] / totals["audio_seconds"] if totals["audio_seconds"] else None
+            ),
+            "items": item_results,
+        }
+
+    def run(self) -> list:
+        """Method to run every configuration, configurations sharing model overrides run back to back"""
+        order = sorted(
+            self.configs,
+            key=lambda name: json.dumps(
+                {key: value for key, value in self.configs[name].items() if key not in RUN_OPTIONS},
+                sort_keys=True,
+            ),
+        )
+        rows = [self.run_config(name, self.configs[name]) for name in order]
+
+        diarization_time_saved(rows)
+
+        scored = [row for row in rows if None not in (row["rtf"], row["wer"], row["der"])]
+        front = pareto_front(scored)
+        for row in rows:
+            row["pareto"] = row["config"] in front
+
+        return sorted(rows, key=lambda row: row["rtf"] if row["rtf"] is not None else float("inf"))
+
+
+def format_table(rows: list) -> str:
+    """Markdown table of the configurations, fastest first"""
+    def cell(value, fmt="{:.3f}"):
+        return "-" if value is None else fmt.format(value)
+
+    lines = [
+        "| Config | RTF | Runtime (s) | WER | DER | Attribution | Trimmed | Diarization saved | Pareto |",
+        "| --- | --- | --- | --- | --- | --- | --- | --- | --- |",
+    ]
+    for row in rows:
+        lines.append(
+            f"| {row['config']} | {cell(row['rtf'])} | {cell(row['runtime'], '{:.1f}')} | {cell(row['wer'])} "
+            f"| {cell(row['der'])} | {cell(row['attribution_accuracy'])} | {cell(row['trimmed_fraction'], '{:.1%}')} "
+            f"| {cell(row['diarization_time_saved'], '{:.1%}')} | {'*' if row['pareto'] else ''} |"
+        )
+
+    return "\n".join(lines)
+
+
+def read_reference_set(manifest_path: str) -> list:
+    """Reference set items with paths resolved relative to the manifest"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    items = []
+
+    with open(manifest_path, encoding="utf-8") as manifest_file:
+        for line in manifest_file:
+            if not line.strip():
+                continue
+
+            item = json.loads(line)
+            for key in ("audio", "reference_transcript", "reference_rttm", "zoom_transcript"):
+                if item.get(key):
+                    item[key] = os.path.join(base_dir, item[key])
+
+            item.setdefault("id", os.path.splitext(os.path.basename(item["audio"]))[0])
+            items.append(item)
+
+    return items
+
+
+def main():
+    """Evaluate the configurations and write the results as JSON"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("reference_set", help="JSONL manifest of the reference set")
+    parser.add_argument("--configs", default=None,
+                        help="JSON file of configuration name to settings, the built-in configurations if not given")
+    parser.add_argument("--only", default=None, help="comma separated configurations to run")
+    parser.add_argument("--output", default="evaluation_results.json", help="machine readable results")
+    args = parser.parse_args()
+
+    configs = EVALUATION_CONFIGS
+    if args.configs:
+        with open(args.configs, encoding="utf-8") as configs_file:
+            configs = json.load(configs_file)
+    if args.only:
+        configs = {name: configs[name] for name in args.only.split(",")}
+
+    evaluator = Evaluator(read_reference_set(args.reference_set), configs, model_kwargs_from_env())
+    rows = evaluator.run()
+
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(rows, output_file, indent=2)
+
+    print(format_table(rows))
+    logging.info("Results written to %s", args.output)
+
+
+if __name__ == "__main__":
+    main()
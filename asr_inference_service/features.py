@@ -0,0 +1,220 @@
+"""
+Whisper log-mel features of a whole recording, computed once and sliced per segment.
+
+Whisper's feature extractor pads every segment to 30s and runs its own STFT, so adjacent
+segments of a long recording repeat most of the FFT work. RecordingLogMel computes the
+log-mel spectrogram of the whole recording once (in chunks to bound memory) and gives
+every segment a frame slice, padded on the feature side to 30s and normalised per segment
+like the feature extractor does. Segment bounds are snapped to the hop length so the
+slices line up with the frames per-segment extraction would compute. Only the frames at
+the segment boundaries differ, since the whole-recording frames see the neighbouring audio
+instead of padding.
+
+The spectrogram is kept in memory as float32, n_mels * 4 bytes per 10ms frame: about
+550 MB for a 3h recording with the 128 mels of large-v3 (275 MB with 80 mels).
+chunk_seconds only bounds the temporary STFT memory on top of that.
+
+Equivalence check and benchmark against per-segment extraction:
+    python -m asr_inference_service.features recording.wav --model-dir /path/to/whisper-large-v3
+"""
+
+import argparse
+import logging
+from time import perf_counter
+
+import librosa
+import numpy as np
+import torch
+from transformers import WhisperFeatureExtractor
+
+logging.basicConfig(
+    format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO
+)
+
+# log10 of the mel floor, the value of zero padded frames
+LOG_MEL_FLOOR = -10.0
+
+
+class RecordingLogMel:
+    """Log-mel spectrogram of a whole recording with per-segment slicing"""
+
+    def __init__(self,
+                 feature_extractor: WhisperFeatureExtractor,
+                 waveform: np.ndarray,
+                 chunk_seconds: float = 300.0,
+                 device: str = 'cpu') -> None:
+        """
+        Inputs:
+            feature_extractor (WhisperFeatureExtractor): feature extractor of the model
+            waveform (np.ndarray): mono recording of shape (T,) at the extractor's sample rate
+            chunk_seconds (float): seconds of audio per STFT chunk, bounds the memory used
+            device (str): device the STFT runs on
+        """
+        self.n_fft = feature_extractor.n_fft
+        self.hop_length = feature_extractor.hop_length
+        self.nb_max_frames = feature_extractor.nb_max_frames
+        self.sampling_rate = feature_extractor.sampling_rate
+        self.mel_filters = feature_extractor.mel_filters
+        self.device = device
+
+        self.log_mel = self.compute(np.asarray(waveform, dtype=np.float32), chunk_seconds)
+
+    def compute(self, waveform: np.ndarray, chunk_seconds: float) -> np.ndarray:
+        """Method to compute the log10 mel spectrogram of the recording, one frame every
+        hop_length samples centred like the feature extractor's STFT
+
+        Returns:
+            log_mel (np.ndarray): shape (n_mels, T // hop_length + 1)
+        """
+        total_frames = len(waveform) // self.hop_length + 1
+        chunk_frames = max(int(chunk_seconds * self.sampling_rate) // self.hop_length, 1)
+        window = torch.hann_window(self.n_fft, device=self.device)
+        mel_filters = torch.from_numpy(self.mel_filters).to(self.device, torch.float32)
+        log_mel = np.empty((mel_filters.shape[1], total_frames), dtype=np.float32)
+
+        for start_frame in range(0, total_frames, chunk_frames):
+            end_frame = min(start_frame + chunk_frames, total_frames)
+            chunk = torch.from_numpy(self.frame_samples(waveform, start_frame, end_frame)).to(self.device)
+
+            stft = torch.stft(
+                chunk, self.n_fft, self.hop_length, window=window, center=False, return_complex=True
+            )
+            mel_spec = mel_filters.T @ (stft.abs() ** 2)
+            log_mel[:, start_frame:end_frame] = torch.clamp(mel_spec, min=1e-10).log10().cpu().numpy()
+
+        return log_mel
+
+    def frame_samples(self, waveform: np.ndarray, start_frame: int, end_frame: int) -> np.ndarray:
+        """Method to cut the samples covered by frames [start_frame, end_frame), reflect
+        padded at the edges of the recording like a centred STFT"""
+        start = start_frame * self.hop_length - self.n_fft // 2
+        end = start + (end_frame - start_frame - 1) * self.hop_length + self.n_fft
+
+        chunk = waveform[max(start, 0):min(end, len(waveform))]
+        left, right = max(-start, 0), max(end - len(waveform), 0)
+
+        if left or right:
+            chunk = np.pad(chunk, (left, right), mode="reflect")
+
+        return chunk
+
+    def snap_bounds(self, bounds: list) -> list:
+        """Method to round segment bounds to the nearest frame, the waveforms cut with the
+        snapped bounds have features that line up with the whole-recording frames
+
+        Inputs:
+            bounds (list): (start_sample, end_sample) of every segment
+
+        Returns:
+            snapped (list): (start_sample, end_sample) multiples of hop_length
+        """
+        return [
+            (
+                int(round(start / self.hop_length)) * self.hop_length,
+                int(round(end / self.hop_length)) * self.hop_length,
+            )
+            for start, end in bounds
+        ]
+
+    def segment_features(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """Method to slice the features of one segment, padded to 30s on the feature side
+        and clamped/normalised over the segment like the feature extractor
+
+        Inputs:
+            start_sample (int): first sample of the segment, see snap_bounds
+            end_sample (int): sample after the last one of the segment
+
+        Returns:
+            features (np.ndarray): shape (n_mels, nb_max_frames)
+        """
+        start_frame = int(round(start_sample / self.hop_length))
+        n_frames = min(int(round((end_sample - start_sample) / self.hop_length)), self.nb_max_frames)
+        frames = self.log_mel[:, start_frame:start_frame + n_frames]
+
+        features = np.full((self.log_mel.shape[0], self.nb_max_frames), LOG_MEL_FLOOR, dtype=np.float32)
+        features[:, :frames.shape[1]] = frames
+        features = np.maximum(features, features.max() - 8.0)
+
+        return (features + 4.0) / 4.0
+
+    def batch_features(self, bounds: list) -> dict:
+        """Method to build the model input of a batch of segments
+
+        Inputs:
+            bounds (list): (start_sample, end_sample) of every segment, each at most 30s,
+                see snap_bounds
+
+        Returns:
+            features (dict): 'input_features' tensor of shape (batch, n_mels, nb_max_frames)
+        """
+        return {
+            "input_features": torch.from_numpy(
+                np.stack([self.segment_features(start, end) for start, end in bounds])
+            )
+        }
+
+
+def main():
+    """Compare sliced whole-recording features with per-segment extraction"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("audio_filepath", help="recording to extract features from")
+    parser.add_argument("--model-dir", required=True, help="local Whisper checkpoint with the feature extractor")
+    parser.add_argument("--segment-length", type=float, default=5.0, help="seconds per segment")
+    parser.add_argument("--chunk-seconds", type=float, default=300.0, help="seconds of audio per STFT chunk")
+    parser.add_argument("--boundary-frames", type=int, default=2,
+                        help="frames at each segment edge left out of the interior comparison")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="largest interior difference accepted")
+    args = parser.parse_args()
+
+    feature_extractor = WhisperFeatureExtractor.from_pretrained(args.model_dir)
+    sample_rate = feature_extractor.sampling_rate
+    waveform, _ = librosa.load(args.audio_filepath, sr=sample_rate, mono=True)
+
+    segment_samples = int(args.segment_length * sample_rate)
+    bounds = [
+        (start, min(start + segment_samples, len(waveform)))
+        for start in range(0, len(waveform) - sample_rate // 10, segment_samples)
+    ]
+
+    sliced_start = perf_counter()
+    recording = RecordingLogMel(feature_extractor, waveform, args.chunk_seconds)
+    bounds = recording.snap_bounds(bounds)
+    sliced = recording.batch_features(bounds)["input_features"].numpy()
+    sliced_time = perf_counter() - sliced_start
+
+    per_segment_start = perf_counter()
+    reference = feature_extractor(
+        [waveform[start:end] for start, end in bounds], sampling_rate=sample_rate, return_tensors="np"
+    )["input_features"]
+    per_segment_time = perf_counter() - per_segment_start
+
+    difference = np.abs(reference - sliced)
+    interior = [
+        difference[idx, :, args.boundary_frames:int((end - start) / feature_extractor.hop_length) - args.boundary_frames]
+        for idx, (start, end) in enumerate(bounds)
+    ]
+    max_interior = max((float(frames.max()) for frames in interior if frames.size), default=0.0)
+
+    logging.info("%s segments of %ss", len(bounds), args.segment_length)
+    logging.info(
+        "Per-segment extraction: %s, whole-recording extraction and slicing: %s, time saved: %s (%.1fx)",
+        per_segment_time,
+        sliced_time,
+        per_segment_time - sliced_time,
+        per_segment_time / sliced_time,
+    )
+    logging.info(
+        "Max difference: %s overall, %s away from segment boundaries, mean difference: %s",
+        float(difference.max()),
+        max_interior,
+        float(difference.mean()),
+    )
+
+    if max_interior > args.tolerance:
+        raise SystemExit(f"Interior difference {max_interior} is above the tolerance {args.tolerance}")
+
+    logging.info("Sliced features match per-segment extraction within %s", args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
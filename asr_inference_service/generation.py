@@ -0,0 +1,97 @@
+"""Guards against runaway Whisper decoding (hallucinated repetitions on music, crosstalk or silence)"""
+
+import zlib
+
+import torch
+from transformers import StoppingCriteria
+
+# Whisper decodes at most 448 tokens per 30s window, 4 of which are the decoder prompt
+MAX_WHISPER_NEW_TOKENS = 444
+WHISPER_WINDOW_SECONDS = 30.0
+
+
+def max_new_tokens_for_duration(duration: float,
+                                tokens_per_second: float,
+                                min_new_tokens: int) -> int:
+    """
+    Token budget of a segment, proportional to its duration (per 30s Whisper window)
+    """
+    window = min(duration, WHISPER_WINDOW_SECONDS)
+
+    return int(min(max(window * tokens_per_second, min_new_tokens), MAX_WHISPER_NEW_TOKENS))
+
+
+def compression_ratio(text: str) -> float:
+    """
+    zlib compression ratio of a text, repeated phrases compress well and give high ratios
+    """
+    text_bytes = text.encode("utf-8")
+
+    if not text_bytes:
+        return 0.0
+
+    return len(text_bytes) / len(zlib.compress(text_bytes))
+
+
+class GenerationGuard(StoppingCriteria):
+    """
+    Stops generation once the token budget is used up or the tail of the output is
+    the same n-gram repeated max_repeats times. Short n-grams must also repeat over at
+    least min_repeat_tokens tokens, so real speech like "yeah, yeah, yeah, yeah" is not cut
+    while a hallucinated loop still is. Records which guard fired per input row, beam
+    search rows are mapped back to the input they belong to.
+    """
+
+    def __init__(self,
+                 max_new_tokens: int,
+                 max_ngram_size: int = 8,
+                 max_repeats: int = 4,
+                 min_repeat_tokens: int = 16,
+                 num_beams: int = 1) -> None:
+        """
+        Inputs:
+            max_new_tokens (int): token budget per window
+            max_ngram_size (int): longest repeated n-gram looked for
+            max_repeats (int): consecutive repeats of an n-gram that stop generation
+            min_repeat_tokens (int): fewest tokens the repeats must span, 1-grams and 2-grams
+                need more than max_repeats repeats
+            num_beams (int): beams per input, generate passes num_beams rows per input
+        """
+        self.max_new_tokens = max_new_tokens
+        self.max_ngram_size = max_ngram_size
+        self.max_repeats = max_repeats
+        self.min_repeat_tokens = min_repeat_tokens
+        self.num_beams = num_beams
+        self.prompt_length = None
+        self.budget_hits = set()
+        self.repetition_hits = set()
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        # First call happens after the first generated token
+        if self.prompt_length is None or input_ids.shape[-1] <= self.prompt_length:
+            self.prompt_length = input_ids.shape[-1] - 1
+
+        generated = input_ids[:, self.prompt_length:]
+        batch_size, length = generated.shape
+
+        over_budget = torch.full(
+            (batch_size,), length >= self.max_new_tokens, dtype=torch.bool, device=input_ids.device
+        )
+        repeating = torch.zeros(batch_size, dtype=torch.bool, device=input_ids.device)
+
+        for ngram_size in range(1, self.max_ngram_size + 1):
+            repeats = max(self.max_repeats, -(-self.min_repeat_tokens // ngram_size))
+            if ngram_size * repeats > length:
+                continue
+
+            tail = generated[:, -ngram_size * repeats:].reshape(batch_size, repeats, ngram_size)
+            repeating |= (tail == tail[:, -1:, :]).all(dim=2).all(dim=1)
+
+        self.budget_hits.update(
+            (torch.nonzero(over_budget).flatten() // self.num_beams).tolist()
+        )
+        self.repetition_hits.update(
+            (torch.nonzero(repeating & ~over_budget).flatten() // self.num_beams).tolist()
+        )
+
+        return over_budget | repeating
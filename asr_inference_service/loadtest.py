@@ -0,0 +1,264 @@
+"""
+HTTP load test for the ASR service.
+
+Replays a mix of requests (short /v1/transcribe clips, /v1/transcribe_diarize_filepath
+uploads and /v1/denoise_filepath uploads) while ramping the number of concurrent clients,
+and reports throughput, latency percentiles, error and 429 rates and server memory.
+
+Usage (against a service started with STUB_MODELS=1 on a laptop):
+    python -m asr_inference_service.loadtest --url http://localhost:8080 \
+        --concurrency 1,10,25,50 --stage-duration 30 --output results.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import random
+from http import HTTPStatus
+from time import perf_counter, time
+
+import httpx
+import numpy as np
+import soundfile as sf
+
+logging.basicConfig(
+    format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO
+)
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_audio(duration: float, seed: int = 0) -> np.ndarray:
+    """Low level noise with tone bursts, enough for the service to have something to process"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    bursts = (np.sin(2 * np.pi * 0.5 * t) > 0).astype(np.float32)
+
+    return (0.01 * rng.standard_normal(len(t)) + 0.3 * bursts * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def wav_bytes(waveform: np.ndarray) -> bytes:
+    """Encode a waveform as wav file bytes"""
+    buffer = io.BytesIO()
+    sf.write(buffer, waveform, SAMPLE_RATE, format="WAV")
+
+    return buffer.getvalue()
+
+
+def percentile(values: list, q: float) -> float:
+    """Percentile of a list, None if the list is empty"""
+    return float(np.percentile(values, q)) if values else None
+
+
+class LoadTest:
+    """Ramps concurrent clients against a running service and records every request"""
+
+    def __init__(self, url: str, mix: dict, clip_durations: list, upload_audio: bytes, timeout: float) -> None:
+        """
+        Inputs:
+            url (str): base url of the service
+            mix (dict): request type to relative weight ('transcribe', 'diarize', 'denoise')
+            clip_durations (list): durations (seconds) of the /v1/transcribe clips
+            upload_audio (bytes): wav file uploaded to the filepath endpoints
+            timeout (float): request timeout in seconds
+        """
+        self.url = url.rstrip("/")
+        self.request_types = list(mix)
+        self.weights = [mix[request_type] for request_type in self.request_types]
+        self.clips = [synthetic_audio(duration, seed).tolist() for seed, duration in enumerate(clip_durations)]
+        self.upload_audio = upload_audio
+        self.timeout = timeout
+        self.records = []
+        self.memory = []
+
+    async def send(self, client: httpx.AsyncClient, request_type: str) -> int:
+        """Send one request of the given type, returns the status code"""
+        if request_type == "transcribe":
+            response = await client.post(
+                f"{self.url}/v1/transcribe", json={"array": random.choice(self.clips)}
+            )
+        else:
+            endpoint = "/v1/transcribe_diarize_filepath" if request_type == "diarize" else "/v1/denoise_filepath"
+            response = await client.post(
+                f"{self.url}{endpoint}",
+                files={"file": ("loadtest.wav", self.upload_audio, "audio/wav")},
+            )
+
+        return response.status_code
+
+    async def client_loop(self, client: httpx.AsyncClient, stage: int, deadline: float) -> None:
+        """One simulated client, sends requests back to back until the deadline"""
+        while perf_counter() < deadline:
+            request_type = random.choices(self.request_types, self.weights)[0]
+            request_start = perf_counter()
+
+            try:
+                status = await self.send(client, request_type)
+            except httpx.HTTPError as error:
+                logging.debug("Request failed: %s", error)
+                status = 0
+
+            self.records.append({
+                "stage": stage,
+                "type": request_type,
+                "status": status,
+                "latency": perf_counter() - request_start,
+                "timestamp": time(),
+            })
+
+    async def memory_loop(self, client: httpx.AsyncClient, interval: float, stop: asyncio.Event) -> None:
+        """Poll the memory of the service until stopped"""
+        while not stop.is_set():
+            try:
+                response = await client.get(f"{self.url}/v1/stats")
+                stats = response.json()
+                self.memory.append({
+                    "timestamp": time(),
+                    "rss_bytes": stats["memory_rss_bytes"],
+                    "peak_bytes": stats["memory_peak_bytes"],
+                })
+            except (httpx.HTTPError, ValueError, KeyError) as error:
+                logging.debug("Stats polling failed: %s", error)
+
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, concurrency_levels: list, stage_duration: float, memory_interval: float) -> list:
+        """Run one stage per concurrency level and return the per-stage summaries"""
+        limits = httpx.Limits(max_connections=max(concurrency_levels) + 1)
+
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+            stop = asyncio.Event()
+            memory_task = asyncio.create_task(self.memory_loop(client, memory_interval, stop))
+            summaries = []
+
+            for stage, concurrency in enumerate(concurrency_levels):
+                logging.info("Stage %s: %s concurrent clients for %ss", stage, concurrency, stage_duration)
+                stage_start = perf_counter()
+                stage_start_time = time()
+                deadline = stage_start + stage_duration
+
+                await asyncio.gather(*[
+                    self.client_loop(client, stage, deadline) for _ in range(concurrency)
+                ])
+
+                summary = self.summarise(
+                    stage, concurrency, perf_counter() - stage_start, stage_start_time, time()
+                )
+                summaries.append(summary)
+                logging.info(
+                    "Stage %s: %.2f req/s, p50 %s, p95 %s, p99 %s, error rate %.3f, 429 rate %.3f",
+                    stage,
+                    summary["throughput"],
+                    summary["latency_p50"],
+                    summary["latency_p95"],
+                    summary["latency_p99"],
+                    summary["error_rate"],
+                    summary["rate_429"],
+                )
+
+            stop.set()
+            await memory_task
+
+        return summaries
+
+    def summarise(self, stage: int, concurrency: int, elapsed: float, start_time: float, end_time: float) -> dict:
+        """Throughput, latency percentiles, error rates and memory of one stage"""
+        records = [record for record in self.records if record["stage"] == stage]
+        successes = [record["latency"] for record in records if record["status"] == HTTPStatus.OK]
+        memory = [
+            sample["rss_bytes"] for sample in self.memory
+            if start_time <= sample["timestamp"] <= end_time
+        ]
+        total = max(len(records), 1)
+
+        summary = {
+            "stage": stage,
+            "concurrency": concurrency,
+            "requests": len(records),
+            "elapsed": elapsed,
+            "throughput": len(successes) / elapsed,
+            "latency_p50": percentile(successes, 50),
+            "latency_p95": percentile(successes, 95),
+            "latency_p99": percentile(successes, 99),
+            "error_rate": sum(record["status"] not in (HTTPStatus.OK, HTTPStatus.TOO_MANY_REQUESTS) for record in records) / total,
+            "rate_429": sum(record["status"] == HTTPStatus.TOO_MANY_REQUESTS for record in records) / total,
+            "memory_rss_max_bytes": max(memory) if memory else None,
+            "per_type": {},
+        }
+
+        for request_type in self.request_types:
+            latencies = [
+                record["latency"] for record in records
+                if record["type"] == request_type and record["status"] == HTTPStatus.OK
+            ]
+            summary["per_type"][request_type] = {
+                "requests": sum(record["type"] == request_type for record in records),
+                "latency_p50": percentile(latencies, 50),
+                "latency_p95": percentile(latencies, 95),
+                "latency_p99": percentile(latencies, 99),
+            }
+
+        return summary
+
+
+def main():
+    """Run the load test and write the results as JSON"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080", help="base url of the service")
+    parser.add_argument("--concurrency", default="1,10,25,50", help="comma separated concurrency levels")
+    parser.add_argument("--stage-duration", type=float, default=30.0, help="seconds per concurrency level")
+    parser.add_argument("--mix", default="transcribe=0.7,diarize=0.2,denoise=0.1",
+                        help="relative weights of the request types")
+    parser.add_argument("--clip-durations", default="1,3,5,10", help="durations (seconds) of the transcribe clips")
+    parser.add_argument("--upload-audio", default=None, help="wav file to upload, synthetic 60s audio if not given")
+    parser.add_argument("--memory-interval", type=float, default=1.0, help="seconds between memory samples")
+    parser.add_argument("--timeout", type=float, default=600.0, help="request timeout in seconds")
+    parser.add_argument("--output", default="loadtest_results.json", help="machine readable results")
+    args = parser.parse_args()
+
+    mix = {
+        request_type: float(weight)
+        for request_type, weight in (entry.split("=") for entry in args.mix.split(","))
+    }
+
+    if args.upload_audio:
+        with open(args.upload_audio, "rb") as audio_file:
+            upload_audio = audio_file.read()
+    else:
+        upload_audio = wav_bytes(synthetic_audio(60.0))
+
+    load_test = LoadTest(
+        args.url,
+        mix,
+        [float(duration) for duration in args.clip_durations.split(",")],
+        upload_audio,
+        args.timeout,
+    )
+    summaries = asyncio.run(load_test.run(
+        [int(level) for level in args.concurrency.split(",")],
+        args.stage_duration,
+        args.memory_interval,
+    ))
+
+    with open(args.output, "w") as output_file:
+        json.dump(
+            {
+                "config": vars(args),
+                "stages": summaries,
+                "memory": load_test.memory,
+                "requests": load_test.records,
+            },
+            output_file,
+            indent=2,
+        )
+
+    logging.info("Results written to %s", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,16 @@ API module for ASR service.
 This module provides the FastAPI application for performing ASR.
 """
 
-import io
+import asyncio
 import json
 import logging
 import os
+import resource
 import tempfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import perf_counter
 from typing import List
 
 import numpy as np
@@ -19,13 +23,28 @@ from fastapi import FastAPI, File, HTTPException, Request, UploadFile
 from pydantic import BaseModel
 from starlette.status import HTTP_200_OK
 
+from asr_inference_service.config import model_kwargs_from_env
 from asr_inference_service.model import ASRModelForInference
-from asr_inference_service.schemas import ASRResponse, HealthResponse, DenoiseResponse
+from asr_inference_service.profiles import DECODING_PROFILES, DEFAULT_PROFILE, profile_workers
+from asr_inference_service.schemas import (
+    ASRResponse,
+    DenoiseResponse,
+    HealthResponse,
+    StatsResponse,
+    UploadCreateRequest,
+    UploadStatusResponse,
+)
 from asr_inference_service.denoise import DENOISER
-from utils.audio_preprocessing import resample_audio_array
+from asr_inference_service.stub import StubASRModel, StubDenoiser
+from asr_inference_service.uploads import UploadError, UploadSpool
+from utils.audio_preprocessing import (
+    COMPRESSED_EXTENSIONS,
+    decode_audio_ffmpeg,
+    resample_audio_array,
+)
 
 SERVICE_HOST = "0.0.0.0"
-SERVICE_PORT = 8080
+SERVICE_PORT = int(os.environ.get("SERVICE_PORT", 8080))
 
 logging.basicConfig(
     format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO
@@ -34,18 +53,19 @@ logging.basicConfig(
 logging.getLogger('nemo_logger').setLevel(logging.ERROR)
 
 app = FastAPI()
-model = ASRModelForInference(
-    model_dir=os.environ["PRETRAINED_MODEL_DIR"],
-    diar_dir=os.environ['PRETRAINED_DIAR_MODEL_DIR'],
+
+# Stub models have no weights, for load tests and local multi-instance setups without GPU
+USE_STUB_MODELS = bool(int(os.environ.get('STUB_MODELS', 0)))
+DenoiserClass = StubDenoiser if USE_STUB_MODELS else DENOISER
+
+model = StubASRModel(
     sample_rate=int(os.environ["SAMPLE_RATE"]),
-    device=os.environ["DEVICE"],
     timestamp_format=os.environ['TIMESTAMPS_FORMAT'],
-    min_segment_length=float(os.environ['MIN_SEGMENT_LENGTH']),
-    min_silence_length=float(os.environ['MIN_SILENCE_LENGTH'])
-)
+    latency_per_second=float(os.environ.get('STUB_LATENCY_PER_SECOND', 0.01))
+) if USE_STUB_MODELS else ASRModelForInference(**model_kwargs_from_env())
 
 if int(os.environ['DENOISER']):
-    denoiser = DENOISER(
+    denoiser = DenoiserClass(
         device=os.environ["DEVICE"],
         dry=float(os.environ["DRY"]),
         amplification_factor=float(os.environ["AMPLIFICATION_FACTOR"])
@@ -53,6 +73,22 @@ if int(os.environ['DENOISER']):
     
 SAMPLE_RATE = int(os.environ["SAMPLE_RATE"])
 
+SUPPORTED_EXTENSIONS = (".wav",) + COMPRESSED_EXTENSIONS
+
+upload_spool = UploadSpool(
+    spool_dir=os.environ.get("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "asr_uploads")),
+    chunk_size=int(os.environ.get("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024)),
+    max_chunk_size=int(os.environ.get("UPLOAD_MAX_CHUNK_SIZE", 64 * 1024 * 1024)),
+    max_total_size=int(os.environ.get("UPLOAD_MAX_SIZE", 20 * 1024**3)),
+    ttl=float(os.environ.get("UPLOAD_TTL", 24 * 3600)),
+)
+
+# One queue per decoding profile so drafts are not stuck behind archival runs
+PROFILE_EXECUTORS = {
+    name: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"profile_{name}")
+    for name, workers in profile_workers(os.environ.get('PROFILE_WORKERS')).items()
+}
+
 class AudioData(BaseModel):
     array: list
 
@@ -73,92 +109,110 @@ async def read_health() -> HealthResponse:
     return {"status": "HEALTHY"}
 
 
+@app.get("/v1/stats", response_model=StatsResponse)
+async def read_stats():
+    """
+    Memory usage of the service process, the generation guard counters and the
+    small/large model routing, polled by the load test to track memory over time.
+    """
+    # ru_maxrss is in kilobytes on Linux
+    memory_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    
+    try:
+        with open("/proc/self/statm") as statm:
+            memory_rss = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        memory_rss = memory_peak
+
+    return {
+        "memory_rss_bytes": memory_rss,
+        "memory_peak_bytes": memory_peak,
+        "guard_counters": dict(getattr(model, "guard_counters", {})),
+        "routing": model.routing_stats() if hasattr(model, "routing_stats") else {},
+    }
+
+
 @app.post("/v1/transcribe", response_model=ASRResponse)
-async def transcribe(data: Request):
+async def transcribe(data: Request, profile: str = DEFAULT_PROFILE):
     """Function call to takes in an audio file as bytes, and executes model inference"""
+    check_profile(profile)
     data = await data.json()
 
-    transcription = model.infer(data["array"], 16000)
+    transcription = await run_in_profile_queue(profile, model.infer, data["array"], 16000)
 
     return {"transcription": str(transcription)}
 
 
 @app.post("/v1/transcribe_filepath", response_model=ASRResponse)
-async def transcribe(file: UploadFile = File(...)):
+async def transcribe(file: UploadFile = File(...), profile: str = DEFAULT_PROFILE):
     """Function call to takes in an audio file as bytes, and executes model inference"""
-    if not file.filename.lower().endswith(".wav"):
-        raise HTTPException(status_code=400, detail="File uploaded is not a wav file.")
-
-    # Receive the audio bytes from the request
-    audio_bytes = file.file.read()
+    check_audio_upload(file)
+    check_profile(profile)
 
-    # load with soundfile, data will be a numpy array
-    data, samplerate = sf.read(io.BytesIO(audio_bytes))
-    transcription = model.infer(data, samplerate)
+    # Compressed files are decoded to 16kHz mono, wav files are loaded with soundfile
+    data, samplerate = await asyncio.to_thread(read_upload, file)
+    transcription = await run_in_profile_queue(profile, model.infer, data, samplerate)
 
     return {"transcription": str(transcription)}
 
 @app.post("/v1/denoise_filepath", response_model=DenoiseResponse)
 async def transcribe(file: UploadFile = File(...)):
     """Function call to takes in an audio file as bytes, and executes model inference"""
-    if not file.filename.lower().endswith(".wav"):
-        raise HTTPException(status_code=400, detail="File uploaded is not a wav file.")
+    check_audio_upload(file)
 
-    with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as temp_file:
-        
-        shutil.copyfileobj(file.file, temp_file)
-        
-        temp_file_path = temp_file.name
-        
-        denoised = denoiser.denoise(temp_file_path)
+    denoised = await denoise_upload(file)
 
     return {"denoise_audio": denoised.tolist()}
 
 @app.post("/v1/transcribe_diarize_filepath", response_model=ASRResponse)
-async def transcribe(file: UploadFile = File(...)):
+async def transcribe(file: UploadFile = File(...), profile: str = DEFAULT_PROFILE):
     """Function call to takes in an audio file as bytes, saves it as a temp .wav file and executes model inference"""
-    if not file.filename.lower().endswith(".wav"):
-        raise HTTPException(status_code=400, detail="File uploaded is not a wav file.")
+    check_audio_upload(file)
+    check_profile(profile)
     
+    if is_compressed(file):
+        # Decoded in memory, no intermediate wav file
+        data, _ = await asyncio.to_thread(read_upload, file)
+        transcription = await run_in_profile_queue(profile, model.diar_inference, data)
+        
+        return {"transcription": str(transcription)}
     
     with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as temp_file:
         # Write the content of the uploaded file to the temporary file
         shutil.copyfileobj(file.file, temp_file)
+        temp_file.flush()
         
         temp_file_path = temp_file.name
-        transcription = model.diar_inference(temp_file_path)
+        transcription = await run_in_profile_queue(profile, model.diar_inference, temp_file_path)
 
     return {"transcription": str(transcription)}
 
 @app.post("/v1/transcribe_diarize_denoise_filepath", response_model=ASRResponse)
-async def transcribe(file: UploadFile = File(...)):
-    """Function call to takes in an audio file as bytes, saves it as a temp .wav file and executes model inference"""
-    if not file.filename.lower().endswith(".wav"):
-        raise HTTPException(status_code=400, detail="File uploaded is not a wav file.")
-    
+async def transcribe(file: UploadFile = File(...), profile: str = DEFAULT_PROFILE):
+    """Function call to takes in an audio file as bytes, saves it as a temp file and executes model inference"""
+    check_audio_upload(file)
+    check_profile(profile)
     
-    with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as temp_file:
-        # Write the content of the uploaded file to the temporary file
-        shutil.copyfileobj(file.file, temp_file)
-        
-        temp_file_path = temp_file.name
-        
-        denoised = denoiser.denoise(temp_file_path)
+    denoised = await denoise_upload(file)
     
-        sf.write(temp_file_path, denoised, int(os.environ["SAMPLE_RATE"]))
-        
-        transcription = model.diar_inference(temp_file_path)
+    # The denoised waveform is diarized and transcribed in memory
+    transcription = await run_in_profile_queue(profile, model.diar_inference, denoised)
 
     return {"transcription": str(transcription)}
 
 @app.post("/v1/transcribe_resample_diarize_filepath", response_model=ASRResponse)
-async def transcribe(file: UploadFile = File(...)):
+async def transcribe(file: UploadFile = File(...), profile: str = DEFAULT_PROFILE):
     """Function call to takes in an audio file as bytes, saves it as a temp .wav file and executes model inference"""
-    if not file.filename.lower().endswith(".wav"):
-        raise HTTPException(status_code=400, detail="File uploaded is not a wav file.")
+    check_audio_upload(file)
+    check_profile(profile)
     
-    audio_bytes = file.file.read()
-    data, samplerate = sf.read(io.BytesIO(audio_bytes))
+    data, samplerate = await asyncio.to_thread(read_upload, file)
+    
+    if is_compressed(file):
+        # Already decoded to the target sample rate and mono
+        transcription = await run_in_profile_queue(profile, model.diar_inference, data)
+        
+        return {"transcription": str(transcription)}
     
     y = resample_audio_array(data, samplerate, SAMPLE_RATE)
     
@@ -166,11 +220,184 @@ async def transcribe(file: UploadFile = File(...)):
         
         sf.write(temp_file, y, SAMPLE_RATE)
         temp_file_path = temp_file.name
-        transcription = model.diar_inference(temp_file_path)
+        transcription = await run_in_profile_queue(profile, model.diar_inference, temp_file_path)
+
+    return {"transcription": str(transcription)}
+
+
+@app.post("/v1/uploads", response_model=UploadStatusResponse)
+async def create_upload(upload: UploadCreateRequest):
+    """Initialise a chunked upload, chunks are then sent to /v1/uploads/{upload_id}/chunks/{index}"""
+    if not upload.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(
+            status_code=400,
+            detail=f"File uploaded is not a supported audio file ({', '.join(SUPPORTED_EXTENSIONS)}).",
+        )
+
+    try:
+        return upload_spool.create(upload.filename, upload.total_size, upload.chunk_size, upload.sha256)
+    except UploadError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+
+@app.get("/v1/uploads/{upload_id}", response_model=UploadStatusResponse)
+async def read_upload_status(upload_id: str):
+    """Received and missing chunks of an upload, used to resume after a dropped connection"""
+    try:
+        return upload_spool.status(upload_id)
+    except UploadError as error:
+        raise HTTPException(status_code=404, detail=str(error))
+
+
+@app.put("/v1/uploads/{upload_id}/chunks/{index}", response_model=UploadStatusResponse)
+async def upload_chunk(upload_id: str, index: int, data: Request):
+    """
+    Stream one chunk (raw request body) into the spool. The optional X-Chunk-SHA256
+    header is checked against the received bytes, failed chunks can be sent again.
+    """
+    try:
+        return await upload_spool.write_chunk(
+            upload_id, index, data.stream(), data.headers.get("X-Chunk-SHA256")
+        )
+    except UploadError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+
+@app.post("/v1/uploads/{upload_id}/transcribe_prefix", response_model=ASRResponse)
+async def transcribe_upload_prefix(upload_id: str, profile: str = DEFAULT_PROFILE):
+    """
+    Diarize and transcribe the contiguous part of an upload received so far, so processing
+    can start before a long upload completes. Containers with their index at the end of
+    the file (e.g. some mp4/m4a) cannot be decoded before the upload is complete.
+
+    This is a preview, finalize transcribes the whole file again and does not reuse it.
+    """
+    check_profile(profile)
+
+    try:
+        prefix = upload_spool.open_prefix(upload_id)
+    except UploadError as error:
+        raise HTTPException(status_code=404, detail=str(error))
+
+    try:
+        data = await asyncio.to_thread(decode_audio_ffmpeg, prefix, SAMPLE_RATE)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    finally:
+        prefix.close()
+
+    transcription = await run_in_profile_queue(profile, model.diar_inference, data)
+
+    return {"transcription": str(transcription)}
+
+
+@app.post("/v1/uploads/{upload_id}/finalize", response_model=ASRResponse)
+async def finalize_upload(upload_id: str, profile: str = DEFAULT_PROFILE):
+    """
+    Verify that every chunk arrived and the whole-file checksum matches, then diarize
+    and transcribe the spooled file and remove it from the spool
+    """
+    check_profile(profile)
+
+    try:
+        data_path = upload_spool.finalise(upload_id)
+        filename = upload_spool.status(upload_id)["filename"]
+    except UploadError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+    try:
+        data = await asyncio.to_thread(decode_audio_ffmpeg, data_path, SAMPLE_RATE)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+    logging.info("Upload %s (%s) finalised, %.2fs of audio", upload_id, filename, len(data) / SAMPLE_RATE)
+    transcription = await run_in_profile_queue(profile, model.diar_inference, data)
+    upload_spool.delete(upload_id)
 
     return {"transcription": str(transcription)}
 
 
+def check_audio_upload(file: UploadFile):
+    """Rejects uploads that are not wav or a compressed format ffmpeg can decode"""
+    if not file.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(
+            status_code=400,
+            detail=f"File uploaded is not a supported audio file ({', '.join(SUPPORTED_EXTENSIONS)}).",
+        )
+
+
+def check_profile(profile: str):
+    """Rejects unknown decoding profiles"""
+    if profile not in DECODING_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown decoding profile {profile} ({', '.join(DECODING_PROFILES)}).",
+        )
+
+
+async def run_in_profile_queue(profile: str, function, *args, **kwargs):
+    """Runs a model call on the queue of its decoding profile, off the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(
+        PROFILE_EXECUTORS[profile], partial(function, *args, profile=profile, **kwargs)
+    )
+
+
+def is_compressed(file: UploadFile) -> bool:
+    """Whether the upload is a compressed audio/video container"""
+    return file.filename.lower().endswith(COMPRESSED_EXTENSIONS)
+
+
+async def denoise_upload(file: UploadFile):
+    """
+    Denoises an upload. The denoiser reads files with torchaudio, which cannot open
+    compressed containers without FFmpeg libraries, so those are decoded with ffmpeg
+    and handed over as a 16kHz mono wav.
+    """
+    with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as temp_file:
+        if is_compressed(file):
+            data, _ = await asyncio.to_thread(read_upload, file)
+            sf.write(temp_file, data, SAMPLE_RATE)
+        else:
+            shutil.copyfileobj(file.file, temp_file)
+        temp_file.flush()
+
+        return denoiser.denoise(temp_file.name)
+
+
+def read_upload(file: UploadFile):
+    """
+    Reads an uploaded audio file into a numpy array. Compressed files are streamed through
+    ffmpeg to 16kHz mono PCM, wav files are read with soundfile at their own sample rate.
+    Logs the ingest time and the bytes transferred to compare both paths.
+
+    Blocks until the file is decoded, async endpoints run it with asyncio.to_thread.
+    """
+    ingest_start = perf_counter()
+    upload_bytes = file.file.seek(0, os.SEEK_END)
+    file.file.seek(0)
+
+    if is_compressed(file):
+        try:
+            data, samplerate = decode_audio_ffmpeg(file.file, SAMPLE_RATE), SAMPLE_RATE
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+    else:
+        data, samplerate = sf.read(file.file)
+
+    duration = len(data) / samplerate
+    logging.info(
+        "Ingested %s: %s bytes uploaded for %.2fs of audio (%s bytes as 16-bit %sHz mono wav). Elapsed time: %s",
+        file.filename,
+        upload_bytes,
+        duration,
+        int(duration * SAMPLE_RATE * 2),
+        SAMPLE_RATE,
+        perf_counter() - ingest_start,
+    )
+
+    return data, samplerate
+
+
 def start():
     """Launched with `start` at root level"""
     uvicorn.run(
@@ -2,14 +2,65 @@
 
 import logging
 import os
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from time import perf_counter
+from typing import Callable, Union
 
 import librosa
 import numpy as np
+import pandas as pd
 import torch
-from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+from transformers import (
+    AutoModelForSpeechSeq2Seq,
+    AutoProcessor,
+    StoppingCriteriaList,
+)
 
 from asr_inference_service.diarizer import PyannoteDiarizer
+from asr_inference_service.features import RecordingLogMel
+from asr_inference_service.generation import (
+    GenerationGuard,
+    compression_ratio,
+    max_new_tokens_for_duration,
+)
+from asr_inference_service.profiles import (
+    DECODING_PROFILES,
+    DEFAULT_PROFILE,
+    get_decoding_profile,
+)
+from asr_inference_service.runtime import compile_whisper
+from asr_inference_service.vad import EnergyVAD
+from utils.audio_preprocessing import COMPRESSED_EXTENSIONS, decode_audio_ffmpeg
+from utils.utils import merge_adjacent_cues
+
+
+def format_segments(segments: pd.DataFrame, timestamp_format: str = 'seconds') -> str:
+    """Function to format transcribed segments into the transcription string
+
+    Inputs:
+        segments (pd.DataFrame): segments with columns ['start_time', 'end_time', 'speaker', 'text']
+        timestamp_format (str): 'seconds' or 'minutes'
+
+    Returns:
+        final_transcription (str): transcription with timestamps attached to it
+    """
+    final_transcription=""
+    
+    for x in range(len(segments)):
+        start_time = segments["start_time"][x]
+        end_time = segments["end_time"][x]
+        
+        if timestamp_format == 'minutes':
+            start_time = start_time/60
+            end_time = end_time/60
+            
+        segment_string = f"[{start_time:.2f} - {end_time:.2f}] [{segments['speaker'][x]}] : {segments['text'][x]}\n\n"
+        final_transcription = "".join([final_transcription, segment_string])
+    
+    return final_transcription
+
 
 class ASRModelForInference:
     """Base class for ASR model for inference"""
@@ -19,31 +70,131 @@ class ASRModelForInference:
                  device: str = 'cpu',
                  timestamp_format: str = 'seconds',
                  min_segment_length = 0.5,
-                 min_silence_length = 0):
+                 min_silence_length = 0,
+                 vad_trim: bool = False,
+                 vad_threshold_db: float = -45.0,
+                 vad_floor_db: float = -60.0,
+                 vad_min_trim_length: float = 2.0,
+                 vad_padding: float = 0.25,
+                 diarization_profile: str = 'default',
+                 segmentation_step: float = None,
+                 embedding_batch_size: int = None,
+                 segmentation_batch_size: int = None,
+                 optimized_runtime: bool = False,
+                 tokens_per_second: float = 8.0,
+                 min_new_tokens: int = 16,
+                 repetition_max_repeats: int = 4,
+                 compression_ratio_threshold: float = 2.4,
+                 fallback_temperature: float = 0.4,
+                 small_model_dir: str = None,
+                 routing_max_duration: float = 3.0,
+                 routing_min_snr_db: float = 15.0,
+                 routing_min_confidence: float = -0.5,
+                 prefetch_batches: int = 2,
+                 precompute_features: bool = False,
+                 feature_chunk_seconds: float = 300.0):
         """
         Inputs:
             model_dir (str): path to model directory
             sample_rate (int): the target sample rate in which the model accepts
+            vad_trim (bool): trim long non-speech spans with an energy VAD before diarization
+            vad_threshold_db (float): VAD threshold relative to the loudest frame
+            vad_floor_db (float): absolute VAD threshold (dBFS), quieter frames are never speech
+            vad_min_trim_length (float): only non-speech spans longer than this (seconds) are trimmed
+            vad_padding (float): seconds of non-speech kept around every trimmed span
+            diarization_profile (str): 'default' or 'fast' pyannote pipeline settings
+            segmentation_step (float): overrides the profile's segmentation step (ratio of window)
+            embedding_batch_size (int): overrides the profile's embedding batch size
+            segmentation_batch_size (int): overrides the profile's segmentation batch size
+            optimized_runtime (bool): compile Whisper's encoder and decoder with torch.compile
+                and warm the compiled graphs up
+            tokens_per_second (float): token budget per second of segment
+            min_new_tokens (int): smallest token budget of a segment
+            repetition_max_repeats (int): consecutive repeats of an n-gram that stop decoding
+            compression_ratio_threshold (float): transcriptions above this ratio are re-decoded
+                with sampling, and dropped if they are still above it
+            fallback_temperature (float): sampling temperature used to re-decode by decoding
+                profiles without their own temperatures
+            small_model_dir (str): optional smaller Whisper checkpoint, short clean segments are
+                transcribed with it and escalated to the large model when it is not confident
+            routing_max_duration (float): longest segment (seconds) routed to the small model
+            routing_min_snr_db (float): segments with a lower energy SNR estimate go to the large model
+            routing_min_confidence (float): small model transcriptions with a lower average token
+                log probability are escalated to the large model
+            prefetch_batches (int): batches of segments whose features are extracted on a thread
+                ahead of generation, 0 extracts them in line
+            precompute_features (bool): compute the log-mel features of the whole recording once
+                and slice them per segment instead of extracting them per segment
+            feature_chunk_seconds (float): seconds of audio per STFT chunk of the precomputation
         """
         
         device = device if device in ['cuda', 'cpu'] else 'cuda' if torch.cuda.is_available() else 'cpu'
         self.device_number = [0] if device == 'cuda' else 1
         self.accelerator = 'gpu' if device == 'cuda' else 'cpu'
         
-        self.init_model(model_dir, device, min_segment_length, min_silence_length)
+        # Also used to align Zoom transcripts when trimming is off
+        self.vad = EnergyVAD(
+            threshold_db=vad_threshold_db,
+            floor_db=vad_floor_db,
+            min_trim_length=vad_min_trim_length,
+            padding=vad_padding,
+        )
+        vad = self.vad if vad_trim else None
+        
+        self.init_model(model_dir, device, min_segment_length, min_silence_length, vad,
+                        profile=diarization_profile,
+                        segmentation_step=segmentation_step,
+                        embedding_batch_size=embedding_batch_size,
+                        segmentation_batch_size=segmentation_batch_size,
+                        optimized_runtime=optimized_runtime)
         self.timestamp_format = timestamp_format if timestamp_format in ['minutes', 'seconds'] else 'seconds'
         logging.info("Running on device: %s", device)
         self.target_sr = sample_rate
+        
+        self.tokens_per_second = tokens_per_second
+        self.min_new_tokens = min_new_tokens
+        self.repetition_max_repeats = repetition_max_repeats
+        self.compression_ratio_threshold = compression_ratio_threshold
+        self.fallback_temperature = fallback_temperature
+        self.guard_counters = Counter()
+        # generate is not thread safe, callers running in parallel (multi-track workers,
+        # profile queues) share the models and only overlap the work around decoding
+        self.generate_lock = threading.Lock()
+        logging.info(
+            "Generation guards. Tokens per second: %s, Compression ratio threshold: %s",
+            self.tokens_per_second,
+            self.compression_ratio_threshold,
+        )
+        
+        self.routing_max_duration = routing_max_duration
+        self.routing_min_snr_db = routing_min_snr_db
+        self.routing_min_confidence = routing_min_confidence
+        self.routing_counters = Counter()
+        self.prefetch_batches = prefetch_batches
+        self.precompute_features = precompute_features
+        self.feature_chunk_seconds = feature_chunk_seconds
+        self.small_model = None
+        if small_model_dir:
+            self.init_small_model(small_model_dir)
+        
+        if optimized_runtime:
+            self.warmup()
 
     def init_model(self,
                    model_dir: str,
                    device: str,
                    min_segment_length: float,
-                   min_silence_length: float):
+                   min_silence_length: float,
+                   vad: EnergyVAD = None,
+                   optimized_runtime: bool = False,
+                   **diarizer_settings):
         """Method to initialise model on class initialisation
 
         Inputs:
             model_dir (str): path to model directory
+            vad (EnergyVAD): optional VAD used to trim silence before diarization
+            optimized_runtime (bool): compile the model with torch.compile
+            diarizer_settings: profile and pipeline overrides passed to PyannoteDiarizer
         """
         logging.info("Loading model...")
         model_load_start = perf_counter()
@@ -52,66 +203,146 @@ class ASRModelForInference:
         # self.diar_model = NemoDiarizer(self.diar_dir, device=self.device_number, accelerator=self.accelerator)
         self.diar_model = PyannoteDiarizer(device = device, 
                                            min_segment_length=min_segment_length,
-                                           min_silence_length=min_silence_length)
+                                           min_silence_length=min_silence_length,
+                                           vad=vad,
+                                           **diarizer_settings)
 
         self.device = device
         self.torch_dtype = torch.float16 if self.device=='cuda' else torch.float32
         logging.info("Torch dtype: %s", self.torch_dtype)
         
-        self.processor = AutoProcessor.from_pretrained(model_dir)
-        self.model = AutoModelForSpeechSeq2Seq.from_pretrained(model_dir)
-        self.model.to(device)
-        self.model.config.forced_decoder_ids = None
-        self.model.eval()
-
-        #################### Set to English and Transcription task ###############
         self.language = "English"
         self.task = "transcribe"
-        self.model.config.forced_decoder_ids = (
-            self.processor.tokenizer.get_decoder_prompt_ids(
+        self.processor, self.model = self.load_whisper(model_dir)
+
+        self.optimized_runtime = optimized_runtime
+        if self.optimized_runtime:
+            self.compile_model()
+
+        model_load_end = perf_counter()
+        logging.info(
+            "Models loaded. Elapsed time: %s", model_load_end - model_load_start
+        )
+
+    def load_whisper(self, model_dir: str):
+        """Method to load a Whisper checkpoint set to English transcription
+
+        Inputs:
+            model_dir (str): path to model directory
+
+        Returns:
+            processor (AutoProcessor), model (AutoModelForSpeechSeq2Seq) on self.device
+        """
+        processor = AutoProcessor.from_pretrained(model_dir)
+        model = AutoModelForSpeechSeq2Seq.from_pretrained(model_dir)
+        model.to(self.device)
+        model.config.forced_decoder_ids = None
+        model.eval()
+
+        #################### Set to English and Transcription task ###############
+        model.config.forced_decoder_ids = (
+            processor.tokenizer.get_decoder_prompt_ids(
                 language=self.language, task=self.task
             )
         )
-        self.model.config.suppress_tokens = []
-        self.model.generation_config.forced_decoder_ids = (
-            self.processor.tokenizer.get_decoder_prompt_ids(
+        model.config.suppress_tokens = []
+        model.generation_config.forced_decoder_ids = (
+            processor.tokenizer.get_decoder_prompt_ids(
                 language=self.language, task=self.task
             )
         )
-        self.model.generation_config.suppress_tokens = []
+        model.generation_config.suppress_tokens = []
         ##########################################################################
 
-        model_load_end = perf_counter()
+        return processor, model
+
+    def init_small_model(self, small_model_dir: str):
+        """Method to load the small Whisper checkpoint that short, clean segments are routed to
+
+        Inputs:
+            small_model_dir (str): path to the small model directory
+        """
+        small_model_load_start = perf_counter()
+        self.small_processor, self.small_model = self.load_whisper(small_model_dir)
+
+        small_model_load_end = perf_counter()
         logging.info(
-            "Models loaded. Elapsed time: %s", model_load_end - model_load_start
+            "Small model loaded. Segments up to %ss with SNR above %s dB are routed to it. Elapsed time: %s",
+            self.routing_max_duration,
+            self.routing_min_snr_db,
+            small_model_load_end - small_model_load_start,
         )
 
-    def load_audio(self, audio_filepath: str) -> np.ndarray:
+    def compile_model(self):
+        """Method to compile the encoder and the decoder, see compile_whisper"""
+        compile_whisper(self.model, self.device)
+
+    def warmup(self):
+        """Method to run the compiled graphs once per batch size and beam count of the decoding
+        profiles so compilation does not happen on the first requests. The encoder input is
+        always padded to 30s and the decoder is compiled with dynamic shapes, so one segment
+        length covers every duration. The counters are reset afterwards so /stats only
+        reports real traffic
+        """
+        segment = np.zeros(int(5.0 * self.target_sr), dtype=np.float32)
+        warmed_up = set()
+        for profile, settings in DECODING_PROFILES.items():
+            shapes = (settings["batch_size"], settings["num_beams"])
+            if shapes in warmed_up:
+                continue
+            warmed_up.add(shapes)
+
+            warmup_start = perf_counter()
+            self.infer_batch([segment] * settings["batch_size"], profile)
+
+            logging.info(
+                "Warm up of profile %s, batch size: %s, beams: %s. Elapsed time: %s",
+                profile,
+                settings["batch_size"],
+                settings["num_beams"],
+                perf_counter() - warmup_start,
+            )
+
+        with self.generate_lock:
+            self.guard_counters.clear()
+            self.routing_counters.clear()
+
+    def load_audio(self, audio_filepath: Union[str, np.ndarray]) -> np.ndarray:
         """Method to load an audio filepath to generate a waveform, it automatically
         standardises the waveform to the target sample rate and channel
 
         Inputs:
-            audio_filepath (str): path to the audio file
+            audio_filepath (str / np.ndarray): path to the audio file (compressed containers are
+                decoded with ffmpeg), or an already decoded mono waveform at the target sample
+                rate which is returned as is
 
         Returns:
             waveform (np.ndarray) of shape (T,)
         """
 
+        if isinstance(audio_filepath, np.ndarray):
+            return audio_filepath
+
+        if str(audio_filepath).lower().endswith(COMPRESSED_EXTENSIONS):
+            return decode_audio_ffmpeg(audio_filepath, self.target_sr)
+
         waveform, _ = librosa.load(audio_filepath, sr=self.target_sr, mono=True)
 
         return waveform
 
-    def infer(self, waveform: np.ndarray, input_sr: int) -> str:
+    def infer(self, waveform: np.ndarray, input_sr: int, profile: str = DEFAULT_PROFILE) -> str:
         """Method to run inference on a waveform to generate a transcription
 
         Inputs:
             waveform (np.ndarray): Takes in waveform of shape (T,)
             input_sr (int): Sample rate of input waveform
+            profile (str): decoding profile, see asr_inference_service.profiles
 
         Returns:
             transcription (str): Output text generated by the ASR model
         """
         inference_start = perf_counter()
+        waveform = np.asarray(waveform)
 
         if input_sr != self.target_sr:
             waveform = librosa.resample(
@@ -122,30 +353,316 @@ class ASRModelForInference:
             logging.info("Converting Steoreo Waveform to Mono Waveform")
             waveform = waveform.mean(axis=1)
 
-        pipe = pipeline(
-            "automatic-speech-recognition",
-            model=self.model,
-            tokenizer=self.processor.tokenizer,
-            feature_extractor=self.processor.feature_extractor,
-            torch_dtype=self.torch_dtype,
-            device=self.device,
-        )
+        transcription = self.infer_batch([waveform], profile)[0]
 
-        transcription = pipe(np.array(waveform))
         inference_end = perf_counter()
         logging.info(
             "Inference Model triggered. Elapsed time: %s",
             inference_end - inference_start,
         )
 
-        return transcription["text"]
+        return transcription
+
+    def infer_batch(self, waveforms: list, profile: str = DEFAULT_PROFILE, features: dict = None) -> list:
+        """Method to transcribe waveforms at the target sample rate. With a small model loaded,
+        short clean segments are tried on it first and only escalated to the large model when
+        its transcription is not confident.
+
+        Inputs:
+            waveforms (list): mono waveforms of shape (T,) at the target sample rate
+            profile (str): decoding profile, see asr_inference_service.profiles
+            features (dict): optional large model features of the waveforms, see extract_features
+
+        Returns:
+            transcriptions (list): Output texts generated by the ASR model, in input order
+        """
+        settings = get_decoding_profile(profile)
+        transcriptions = [None] * len(waveforms)
+
+        if self.small_model is not None and settings["small_model_routing"]:
+            for idx, transcription in self.small_model_infer(waveforms).items():
+                transcriptions[idx] = transcription
+
+        escalated = [idx for idx, transcription in enumerate(transcriptions) if transcription is None]
+
+        if escalated:
+            large_start = perf_counter()
+            large_waveforms = [waveforms[idx] for idx in escalated]
+
+            if features is not None and len(escalated) < len(waveforms):
+                features = {key: value[escalated] for key, value in features.items()}
+
+            large_transcriptions = self.large_model_infer(large_waveforms, settings, features)
+            for idx, transcription in zip(escalated, large_transcriptions):
+                transcriptions[idx] = transcription
+
+            large_elapsed = perf_counter() - large_start
+            # Counters are shared by the parallel callers, updated under the generate lock
+            with self.generate_lock:
+                self.routing_counters["large_segments"] += len(escalated)
+                self.routing_counters["large_audio_seconds"] += sum(map(len, large_waveforms)) / self.target_sr
+                self.routing_counters["large_elapsed"] += large_elapsed
+
+        return transcriptions
+
+    def large_model_infer(self, waveforms: list, settings: dict, features: dict = None) -> list:
+        """Method to transcribe waveforms with the large model in one generate call.
+        Transcriptions above the compression ratio threshold are re-decoded with sampling at
+        the profile's temperatures, and dropped if they are still above it.
+
+        Inputs:
+            waveforms (list): mono waveforms of shape (T,) at the target sample rate
+            settings (dict): decoding profile settings
+            features (dict): optional precomputed features of the waveforms
+
+        Returns:
+            transcriptions (list): Output texts generated by the ASR model, in input order
+        """
+        temperatures = settings["temperatures"]
+        if temperatures is None:
+            temperatures = (self.fallback_temperature,)
+
+        duration = max(len(waveform) for waveform in waveforms) / self.target_sr
+        transcriptions = self.guarded_generate(waveforms, duration, settings, features)
+
+        for idx, waveform in enumerate(waveforms):
+            for temperature in temperatures:
+                if compression_ratio(transcriptions[idx]) <= self.compression_ratio_threshold:
+                    break
+
+                # Likely a hallucinated loop, re-decode with sampling
+                self.guard_counters["compression_fallback"] += 1
+                transcriptions[idx] = self.guarded_generate(
+                    [waveform],
+                    len(waveform) / self.target_sr,
+                    settings,
+                    do_sample=True,
+                    temperature=temperature,
+                    num_beams=1,
+                )[0]
+
+            if compression_ratio(transcriptions[idx]) > self.compression_ratio_threshold:
+                self.guard_counters["dropped"] += 1
+                transcriptions[idx] = ""
+
+        return transcriptions
+
+    def segment_snr_db(self, waveform: np.ndarray) -> float:
+        """Method to estimate the SNR of a segment as the spread between its loud (speech)
+        and quiet (noise floor) frame energies
+
+        Inputs:
+            waveform (np.ndarray): waveform of shape (T,) at the target sample rate
+
+        Returns:
+            snr (float): SNR estimate in dB, 0 for segments shorter than two frames
+        """
+        energy = self.vad.frame_energy(waveform, self.target_sr)
+
+        if len(energy) < 2:
+            return 0.0
+
+        return float(np.percentile(energy, 95) - np.percentile(energy, 10))
+
+    def small_model_infer(self, waveforms: list) -> dict:
+        """Method to transcribe the short, clean waveforms with the small model. Transcriptions
+        with a low average token log probability or a high compression ratio are left out
+        so they are escalated to the large model.
+
+        Inputs:
+            waveforms (list): mono waveforms of shape (T,) at the target sample rate
+
+        Returns:
+            transcriptions (dict): index in waveforms to accepted transcription
+        """
+        candidates = [
+            idx for idx, waveform in enumerate(waveforms)
+            if len(waveform) / self.target_sr <= self.routing_max_duration
+            and self.segment_snr_db(waveform) >= self.routing_min_snr_db
+        ]
+
+        if not candidates:
+            return {}
+
+        small_start = perf_counter()
+        texts, confidences = self.small_generate([waveforms[idx] for idx in candidates])
+        small_elapsed = perf_counter() - small_start
+
+        transcriptions = {
+            idx: text
+            for idx, text, confidence in zip(candidates, texts, confidences)
+            if confidence >= self.routing_min_confidence
+            and compression_ratio(text) <= self.compression_ratio_threshold
+        }
+
+        with self.generate_lock:
+            self.routing_counters["small_elapsed"] += small_elapsed
+            self.routing_counters["small_candidates"] += len(candidates)
+            self.routing_counters["escalated"] += len(candidates) - len(transcriptions)
+            self.routing_counters["small_segments"] += len(transcriptions)
+            self.routing_counters["small_audio_seconds"] += (
+                sum(len(waveforms[idx]) for idx in transcriptions) / self.target_sr
+            )
+
+        return transcriptions
+
+    def small_generate(self, waveforms: list):
+        """Method to decode waveforms with the small model, greedy and guarded like the large model
+
+        Inputs:
+            waveforms (list): waveforms of shape (T,) at the target sample rate, decoded as one batch
+
+        Returns:
+            texts (list): Output texts generated by the small model
+            confidences (list): average log probability of the generated tokens per waveform
+        """
+        features = self.extract_features(waveforms, self.small_processor)
+        guard = GenerationGuard(
+            max_new_tokens_for_duration(
+                max(map(len, waveforms)) / self.target_sr, self.tokens_per_second, self.min_new_tokens
+            ),
+            max_repeats=self.repetition_max_repeats,
+        )
+
+        with self.generate_lock, torch.no_grad():
+            outputs = self.small_model.generate(
+                features["input_features"].to(self.device, dtype=self.small_model.dtype),
+                stopping_criteria=StoppingCriteriaList([guard]),
+                return_dict_in_generate=True,
+                output_scores=True,
+            )
+
+        # One score per generated token, the tokens are the tail of the sequences
+        tokens = outputs.sequences[:, -len(outputs.scores):]
+        token_logprobs = torch.stack(
+            [
+                torch.log_softmax(score.float(), dim=-1).gather(-1, tokens[:, step:step + 1]).squeeze(-1)
+                for step, score in enumerate(outputs.scores)
+            ],
+            dim=1,
+        )
+        generated = tokens != self.small_model.generation_config.eos_token_id
+        confidences = (
+            torch.where(generated, token_logprobs, torch.zeros_like(token_logprobs)).sum(dim=1)
+            / generated.sum(dim=1).clamp(min=1)
+        ).tolist()
+        texts = self.small_processor.tokenizer.batch_decode(outputs.sequences, skip_special_tokens=True)
+
+        return texts, confidences
+
+    def routing_stats(self) -> dict:
+        """Method to summarise the routing between the small and the large model
+
+        Returns:
+            stats (dict): segment counts, routing and escalation ratios, and the large model
+                time saved (seconds) estimated from the large model's measured real-time factor
+        """
+        with self.generate_lock:
+            counters = Counter(self.routing_counters)
+        total_segments = counters["small_segments"] + counters["large_segments"]
+        large_rtf = (
+            counters["large_elapsed"] / counters["large_audio_seconds"]
+            if counters["large_audio_seconds"]
+            else 0.0
+        )
+
+        return {
+            **counters,
+            "small_ratio": counters["small_segments"] / total_segments if total_segments else 0.0,
+            "escalation_ratio": (
+                counters["escalated"] / counters["small_candidates"] if counters["small_candidates"] else 0.0
+            ),
+            "compute_saved_seconds": counters["small_audio_seconds"] * large_rtf - counters["small_elapsed"],
+        }
 
-    def diar_inference(self, filepath: str):
+    def extract_features(self, waveforms: list, processor: AutoProcessor = None) -> dict:
+        """Method to compute the log-mel features of a batch of waveforms. Batches up to 30s
+        are padded to 30s, longer batches are padded to the longest waveform and get an
+        attention mask for long-form decoding.
+
+        Inputs:
+            waveforms (list): waveforms of shape (T,) at the target sample rate
+            processor (AutoProcessor): processor of the model the features are for, large model if None
+
+        Returns:
+            features (dict): 'input_features' and, for long-form batches, 'attention_mask'
+        """
+        processor = processor or self.processor
+        long_form = max(map(len, waveforms)) > processor.feature_extractor.n_samples
+
+        features = processor.feature_extractor(
+            [np.array(waveform) for waveform in waveforms],
+            sampling_rate=self.target_sr,
+            return_tensors="pt",
+            truncation=not long_form,
+            padding="longest" if long_form else "max_length",
+            return_attention_mask=long_form,
+        )
+
+        return dict(features)
+
+    def guarded_generate(self, waveforms: list,
+                         duration: float,
+                         settings: dict,
+                         features: dict = None,
+                         **generate_kwargs) -> list:
+        """Method to decode waveforms with a token budget proportional to their duration and
+        early stopping on repeated n-grams
+
+        Inputs:
+            waveforms (list): waveforms of shape (T,) at the target sample rate, decoded as one batch
+            duration (float): duration of the longest waveform in seconds
+            settings (dict): decoding profile settings
+            features (dict): optional precomputed features of the waveforms, extracted if None
+            generate_kwargs: extra arguments for generate, e.g. sampling for the fallback
+
+        Returns:
+            transcriptions (list): Output texts generated by the ASR model
+        """
+        if features is None:
+            features = self.extract_features(waveforms)
+
+        # Segments longer than 30s are decoded long-form, which needs timestamp tokens
+        long_form = "attention_mask" in features
+        num_beams = generate_kwargs.pop("num_beams", settings["num_beams"])
+        guard = GenerationGuard(
+            max_new_tokens_for_duration(duration, self.tokens_per_second, self.min_new_tokens),
+            max_repeats=self.repetition_max_repeats,
+            num_beams=num_beams,
+        )
+
+        with self.generate_lock, torch.no_grad():
+            sequences = self.model.generate(
+                features["input_features"].to(self.device, dtype=self.model.dtype),
+                attention_mask=features["attention_mask"].to(self.device) if long_form else None,
+                stopping_criteria=StoppingCriteriaList([guard]),
+                num_beams=num_beams,
+                return_timestamps=long_form,
+                **generate_kwargs,
+            )
+
+            self.guard_counters["segments"] += len(waveforms)
+            self.guard_counters["token_budget"] += len(guard.budget_hits)
+            self.guard_counters["repetition"] += len(guard.repetition_hits)
+
+        return self.processor.tokenizer.batch_decode(sequences, skip_special_tokens=True)
+
+    def diar_inference(self, filepath: Union[str, np.ndarray],
+                       num_speakers: int = None,
+                       min_speakers: int = None,
+                       max_speakers: int = None,
+                       progress_callback: Callable = None,
+                       profile: str = DEFAULT_PROFILE):
         """Method to call vad methods and using segments of speech to transcribe using the infer method
 
         Inputs:
-            waveform (np.ndarray): Takes in waveform of shape (T,)
-            input_sr (int): Sample rate of input waveform
+            filepath (str / np.ndarray): path to the audio file, or a mono waveform at the target sample rate
+            num_speakers (int): optional exact number of speakers, e.g. from a Zoom transcript
+            min_speakers (int): optional lower bound on the number of speakers
+            max_speakers (int): optional upper bound on the number of speakers
+            progress_callback (Callable): called as (stage, completed, total) during diarization
+                and before every batch of segments, raising in it cancels the job
+            profile (str): decoding profile, see asr_inference_service.profiles
 
         Returns:
             final_transcription (str): transcription with timestamps attached to it
@@ -155,36 +672,336 @@ class ASRModelForInference:
             "Diarization Model triggered."
         )
         
-        segments = self.diar_model.diarize(filepath)
-        waveform = self.load_audio(filepath)
+        hook = None
+        if progress_callback is not None:
+            def hook(step_name, step_artefact, file=None, total=None, completed=None):
+                progress_callback(f"Diarization ({step_name})", completed or 0, total or 1)
+        
+        def timed_load_audio():
+            load_start = perf_counter()
+            return self.load_audio(filepath), perf_counter() - load_start
+        
+        # Decoding the audio for transcription does not depend on diarization
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            load_future = executor.submit(timed_load_audio)
+            segments = self.diar_model.diarize(filepath,
+                                               hook=hook,
+                                               num_speakers=num_speakers,
+                                               min_speakers=min_speakers,
+                                               max_speakers=max_speakers)
+            diarization_time = perf_counter() - diarizer_start
+            waveform, load_time = load_future.result()
         
         diarizer_end = perf_counter()
         logging.info(
-            "Diarization Model Done. Elapsed time: %s",
+            "Diarization Model Done. Elapsed time: %s (diarization: %s, audio decode: %s, overlapped: %s)",
             diarizer_end - diarizer_start,
+            diarization_time,
+            load_time,
+            diarization_time + load_time - (diarizer_end - diarizer_start),
         )
         
-        final_transcription=""
-        
-        for x in range(len(segments)):
-            start_time = segments["start_time"][x]
-            end_time = segments["end_time"][x]
-            
-            start_frame = int(start_time * self.target_sr)
-            end_frame = int(end_time * self.target_sr)
+        return self.transcribe_segments(waveform, segments, progress_callback, profile)
 
-            split_audio = waveform[start_frame:end_frame]
+    def transcribe_segments(self, waveform: np.ndarray,
+                            segments: pd.DataFrame,
+                            progress_callback: Callable = None,
+                            profile: str = DEFAULT_PROFILE) -> str:
+        """Method to transcribe every segment of a waveform using the infer method
 
-            transcription = self.infer(split_audio, self.target_sr)
+        Inputs:
+            waveform (np.ndarray): waveform of shape (T,) at the target sample rate
+            segments (pd.DataFrame): segments with columns ['start_time', 'end_time', 'speaker']
+            progress_callback (Callable): called as (stage, completed, total) before every batch of segments
+            profile (str): decoding profile, see asr_inference_service.profiles
+
+        Returns:
+            final_transcription (str): transcription with timestamps attached to it
+        """
+        return self.format_segments(
+            self.transcribe_segment_texts(waveform, segments, progress_callback, profile=profile)
+        )
+
+    def transcribe_segment_texts(self, waveform: np.ndarray,
+                                 segments: pd.DataFrame,
+                                 progress_callback: Callable = None,
+                                 stage: str = "Transcription",
+                                 profile: str = DEFAULT_PROFILE) -> pd.DataFrame:
+        """Method to fill the 'text' column of the segments, decoded in batches of the
+        profile's batch size. Segments are batched by duration so every batch gets a
+        tight token budget, and the features of the next batches are extracted on a
+        thread while the current batch generates.
+
+        Inputs:
+            waveform (np.ndarray): waveform of shape (T,) at the target sample rate
+            segments (pd.DataFrame): segments with columns ['start_time', 'end_time', 'speaker']
+            progress_callback (Callable): called as (stage, completed, total) before every batch of segments
+            stage (str): stage name reported to progress_callback
+            profile (str): decoding profile, see asr_inference_service.profiles
+
+        Returns:
+            segments (pd.DataFrame): the same segments with the 'text' column filled in
+        """
+        transcription_start = perf_counter()
+        batch_size = get_decoding_profile(profile)["batch_size"]
+        segments = segments.reset_index(drop=True)
+        texts = [""] * len(segments)
+        order = np.argsort(
+            (segments["end_time"] - segments["start_time"]).to_numpy(dtype=float), kind="stable"
+        )
+        
+        batches = [order[batch_start:batch_start + batch_size] for batch_start in range(0, len(order), batch_size)]
+        timings = Counter()
+        
+        recording_features = None
+        if self.precompute_features and len(segments):
+            precompute_start = perf_counter()
+            recording_features = RecordingLogMel(
+                self.processor.feature_extractor, waveform, self.feature_chunk_seconds, self.device
+            )
+            timings["features"] += perf_counter() - precompute_start
+            logging.info(
+                "Whole-recording log-mel features: %s frames. Elapsed time: %s",
+                recording_features.log_mel.shape[1],
+                perf_counter() - precompute_start,
+            )
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # Bounded prefetch queue, at most prefetch_batches batches are extracted ahead
+            prefetched = deque(
+                executor.submit(self.prepare_batch, waveform, segments, batch, recording_features)
+                for batch in batches[:self.prefetch_batches]
+            )
             
-            if self.timestamp_format == 'minutes':
-                start_time = start_time/60
-                end_time = end_time/60
+            for batch_idx, batch in enumerate(batches):
+                if progress_callback is not None:
+                    progress_callback(stage, batch_idx * batch_size, len(segments))
+                
+                wait_start = perf_counter()
+                if prefetched:
+                    split_audios, features, feature_time = prefetched.popleft().result()
+                else:
+                    split_audios, features, feature_time = self.prepare_batch(
+                        waveform, segments, batch, recording_features
+                    )
+                timings["waiting"] += perf_counter() - wait_start
+                timings["features"] += feature_time
+                
+                if batch_idx + self.prefetch_batches < len(batches):
+                    prefetched.append(executor.submit(
+                        self.prepare_batch,
+                        waveform,
+                        segments,
+                        batches[batch_idx + self.prefetch_batches],
+                        recording_features,
+                    ))
                 
-            segment_string = f"[{start_time:.2f} - {end_time:.2f}] [{segments['speaker'][x]}] : {transcription}\n\n"
-            final_transcription = "".join([final_transcription, segment_string])
+                generation_start = perf_counter()
+                for x, text in zip(batch, self.infer_batch(split_audios, profile, features)):
+                    texts[x] = text
+                timings["generation"] += perf_counter() - generation_start
         
-        return final_transcription
+        if progress_callback is not None:
+            progress_callback(stage, len(segments), len(segments))
+        
+        transcription_end = perf_counter()
+        logging.info(
+            "Transcribed %s segments with the %s profile. Elapsed time: %s "
+            "(features: %s, generation: %s, waiting for features: %s, overlapped: %s)",
+            len(segments),
+            profile,
+            transcription_end - transcription_start,
+            timings["features"],
+            timings["generation"],
+            timings["waiting"],
+            timings["features"] - timings["waiting"],
+        )
+        logging.info("Generation guard counters: %s", dict(self.guard_counters))
+        if self.small_model is not None:
+            logging.info("Model routing: %s", self.routing_stats())
+        segments["text"] = texts
+        
+        return segments
+
+    def prepare_batch(self, waveform: np.ndarray,
+                      segments: pd.DataFrame,
+                      batch: np.ndarray,
+                      recording_features: RecordingLogMel = None):
+        """Method to cut a batch of segments out of the waveform and extract their features,
+        runs on the prefetch thread
+
+        Inputs:
+            waveform (np.ndarray): waveform of shape (T,) at the target sample rate
+            segments (pd.DataFrame): segments with columns ['start_time', 'end_time']
+            batch (np.ndarray): indices of the segments in the batch
+            recording_features (RecordingLogMel): optional whole-recording features the
+                segments are sliced from, batches with segments over 30s are extracted instead
+
+        Returns:
+            split_audios (list), features (dict), feature_time (float): the segment waveforms,
+                their features and the extraction time in seconds
+        """
+        feature_start = perf_counter()
+        bounds = [
+            (int(segments["start_time"][x] * self.target_sr), int(segments["end_time"][x] * self.target_sr))
+            for x in batch
+        ]
+        if recording_features is not None:
+            # The waveforms are cut on frame boundaries so they match the sliced features
+            bounds = recording_features.snap_bounds(bounds)
+
+        split_audios = [waveform[start:end] for start, end in bounds]
+
+        if recording_features is not None and max(map(len, split_audios)) <= self.processor.feature_extractor.n_samples:
+            features = recording_features.batch_features(bounds)
+        else:
+            features = self.extract_features(split_audios)
+
+        return split_audios, features, perf_counter() - feature_start
+
+    def format_segments(self, segments: pd.DataFrame) -> str:
+        """Method to format transcribed segments into the transcription string
+
+        Inputs:
+            segments (pd.DataFrame): segments with columns ['start_time', 'end_time', 'speaker', 'text']
+
+        Returns:
+            final_transcription (str): transcription with timestamps attached to it
+        """
+        return format_segments(segments, self.timestamp_format)
+
+    def zoom_inference(self, filepath: Union[str, np.ndarray],
+                       cues: list,
+                       start_seconds: float = None,
+                       end_seconds: float = None,
+                       max_offset: float = 30.0,
+                       max_gap: float = 1.0,
+                       progress_callback: Callable = None,
+                       profile: str = DEFAULT_PROFILE):
+        """Method to transcribe using the utterance boundaries of a Zoom transcript instead
+        of diarization. The clock offset between the transcript and the audio is estimated
+        from the audio energy envelope.
+
+        Inputs:
+            filepath (str / np.ndarray): path to the audio file, or a mono waveform at the target sample rate
+            cues (list): [start_seconds, end_seconds, speaker] from the Zoom transcript
+            start_seconds (float): optional start (transcript clock) of the window to transcribe
+            end_seconds (float): optional end (transcript clock) of the window to transcribe
+            max_offset (float): largest clock offset (seconds) searched in either direction
+            max_gap (float): consecutive cues of the same speaker closer than this are merged
+            progress_callback (Callable): called as (stage, completed, total) before every batch of segments
+            profile (str): decoding profile, see asr_inference_service.profiles
+
+        Returns:
+            final_transcription (str): transcription with timestamps and speaker names attached to it
+        """
+        alignment_start = perf_counter()
+        logging.info("Zoom-aligned segmentation triggered.")
+        
+        waveform = self.load_audio(filepath)
+        duration = len(waveform) / self.target_sr
+        offset = self.vad.estimate_offset(waveform, self.target_sr, cues, max_offset)
+        
+        if start_seconds is not None:
+            cues = [cue for cue in cues if cue[1] >= start_seconds]
+        if end_seconds is not None:
+            cues = [cue for cue in cues if cue[0] <= end_seconds]
+        
+        shifted_cues = [
+            [max(start + offset, 0), min(end + offset, duration), speaker]
+            for start, end, speaker in cues
+        ]
+        merged_cues = [
+            cue for cue in merge_adjacent_cues(shifted_cues, max_gap)
+            if cue[1] - cue[0] > 0
+        ]
+        
+        segments = pd.DataFrame(
+            [[round(start, 3), round(end, 3), speaker, ''] for start, end, speaker in merged_cues],
+            columns=['start_time', 'end_time', 'speaker', 'text'],
+        )
+        
+        alignment_end = perf_counter()
+        logging.info(
+            "Zoom-aligned segmentation Done. %s cues merged into %s segments. Elapsed time: %s",
+            len(cues),
+            len(segments),
+            alignment_end - alignment_start,
+        )
+        
+        return self.transcribe_segments(waveform, segments, progress_callback, profile)
+
+    def multitrack_inference(self, tracks: dict,
+                             num_workers: int = 4,
+                             progress_callback: Callable = None,
+                             profile: str = DEFAULT_PROFILE):
+        """Method to transcribe separate per-participant recordings (e.g. Zoom's "record a
+        separate audio file for each participant") without diarization. Speech regions of
+        every track are found with the energy VAD and the tracks are transcribed in parallel,
+        decoding, VAD and feature extraction overlap while generate calls are serialised.
+
+        Inputs:
+            tracks (dict): track name (used as the speaker label) to audio filepath
+            num_workers (int): number of tracks transcribed at the same time
+            progress_callback (Callable): called as (stage, completed, total) before every batch of segments of every track
+            profile (str): decoding profile, see asr_inference_service.profiles
+
+        Returns:
+            final_transcription (str): time-ordered transcription with timestamps and track names attached to it
+        """
+        multitrack_start = perf_counter()
+        logging.info("Multi-track transcription triggered for %s tracks.", len(tracks))
+        
+        with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+            track_segments = list(executor.map(
+                lambda track: self.transcribe_track(*track, progress_callback, profile), tracks.items()
+            ))
+        
+        segments = pd.concat(
+            [pd.DataFrame(columns=['start_time', 'end_time', 'speaker', 'text'])] + track_segments,
+            ignore_index=True,
+        )
+        segments = segments.sort_values('start_time', kind='stable').reset_index(drop=True)
+        
+        multitrack_end = perf_counter()
+        logging.info(
+            "Multi-track transcription Done. Elapsed time: %s",
+            multitrack_end - multitrack_start,
+        )
+        
+        return self.format_segments(segments)
+
+    def transcribe_track(self, name: str,
+                         filepath: str,
+                         progress_callback: Callable = None,
+                         profile: str = DEFAULT_PROFILE) -> pd.DataFrame:
+        """Method to transcribe the speech regions of a single speaker track
+
+        Inputs:
+            name (str): track name used as the speaker label
+            filepath (str): path to the audio file
+            progress_callback (Callable): called as (stage, completed, total) before every batch of segments
+            profile (str): decoding profile, see asr_inference_service.profiles
+
+        Returns:
+            segments (pd.DataFrame): transcribed segments with columns ['start_time', 'end_time', 'speaker', 'text']
+        """
+        waveform = self.load_audio(filepath)
+        regions = self.vad.speech_regions(waveform, self.target_sr) / self.target_sr
+        
+        segments = pd.DataFrame(
+            [
+                [round(start, 3), round(end, 3), name, '']
+                for start, end in regions
+                if end - start >= self.diar_model.min_segment_length
+            ],
+            columns=['start_time', 'end_time', 'speaker', 'text'],
+        )
+        logging.info("Track %s: %s speech regions", name, len(segments))
+        
+        return self.transcribe_segment_texts(
+            waveform, segments, progress_callback, stage=f"Transcription ({name})", profile=profile
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+"""Named decoding profiles trading transcription speed against quality"""
+
+# num_beams: beam count of generate
+# temperatures: sampling temperatures tried in order when a decode fails the compression
+#     ratio check, the segment is dropped once they are used up. None uses the model's
+#     fallback_temperature
+# batch_size: segments decoded together in one generate call
+# small_model_routing: short clean segments are tried on the small model first (if loaded)
+# workers: jobs of this profile running at the same time, every profile has its own queue.
+#     The queues share the models and generate calls are serialised, so jobs of different
+#     profiles only overlap audio decoding, diarization and feature extraction
+DECODING_PROFILES = {
+    "draft": {
+        "num_beams": 1,
+        "temperatures": (),
+        "batch_size": 16,
+        "small_model_routing": True,
+        "workers": 2,
+    },
+    "standard": {
+        "num_beams": 1,
+        "temperatures": None,
+        "batch_size": 8,
+        "small_model_routing": True,
+        "workers": 1,
+    },
+    "archival": {
+        "num_beams": 5,
+        "temperatures": (0.2, 0.4, 0.6, 0.8, 1.0),
+        "batch_size": 1,
+        "small_model_routing": False,
+        "workers": 1,
+    },
+}
+
+DEFAULT_PROFILE = "standard"
+
+
+def get_decoding_profile(name: str) -> dict:
+    """
+    Settings of a decoding profile, raises ValueError for unknown names
+    """
+    if name not in DECODING_PROFILES:
+        raise ValueError(
+            f"Unknown decoding profile {name}, choose from {', '.join(DECODING_PROFILES)}."
+        )
+
+    return DECODING_PROFILES[name]
+
+
+def profile_workers(spec: str = None) -> dict:
+    """
+    Jobs per profile queue, spec overrides the profiles' defaults as "draft=4,archival=1"
+    """
+    workers = {name: settings["workers"] for name, settings in DECODING_PROFILES.items()}
+
+    for entry in filter(None, (spec or "").split(",")):
+        name, count = entry.split("=")
+        get_decoding_profile(name.strip())
+        workers[name.strip()] = int(count)
+
+    return workers
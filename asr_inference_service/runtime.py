@@ -0,0 +1,32 @@
+"""Optimized Whisper runtime with torch.compile"""
+
+import logging
+
+import torch
+
+logging.basicConfig(
+    format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO
+)
+
+
+def compile_whisper(model, device: str) -> None:
+    """Function to compile the encoder and the decoder of a Whisper model in place.
+
+    Whisper pads every 30s window to 3000 frames so the encoder shapes only change with
+    the batch size, it uses CUDA graphs ("reduce-overhead") on GPU. The decoder runs with
+    the default dynamic KV cache, whose length grows every step, so it is compiled with
+    dynamic shapes and without CUDA graphs. (transformers 4.42 has no static cache for
+    Whisper.)
+
+    Inputs:
+        model (WhisperForConditionalGeneration): model to compile
+        device (str): 'cuda' or 'cpu'
+    """
+    encoder_mode = "reduce-overhead" if device == 'cuda' else "default"
+    logging.info("Compiling model with torch.compile, encoder mode: %s", encoder_mode)
+
+    encoder = model.get_encoder()
+    encoder.forward = torch.compile(encoder.forward, mode=encoder_mode)
+
+    decoder = model.get_decoder()
+    decoder.forward = torch.compile(decoder.forward, dynamic=True)
@@ -1,5 +1,7 @@
 """Schemas for the API service"""
 
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 
@@ -26,6 +28,64 @@ class DenoiseResponse(BaseModel):
     status_code: int = 200
     denoise_audio: list
 
+# pylint: disable=too-few-public-methods
+class UploadCreateRequest(BaseModel):
+    """Request to initialise a chunked upload
+
+    Attributes:
+        filename (str): original file name, its extension decides how the file is decoded
+        total_size (int): size of the whole file in bytes
+        chunk_size (int): size of every chunk but the last, service default if not given
+        sha256 (str): optional checksum of the whole file, verified on finalise
+    """
+
+    filename: str
+    total_size: int
+    chunk_size: Optional[int] = None
+    sha256: Optional[str] = None
+
+# pylint: disable=too-few-public-methods
+class UploadStatusResponse(BaseModel):
+    """Status of a chunked upload, used to resume it
+
+    Attributes:
+        upload_id (str): id of the upload
+        filename (str): original file name
+        chunk_size (int): size of every chunk but the last
+        total_chunks (int): number of chunks of the whole file
+        received_chunks (list): chunks stored so far, as inclusive [first, last] ranges
+        missing_chunks (list): chunks still to be sent, as inclusive [first, last] ranges
+        prefix_bytes (int): contiguous bytes received from the start of the file
+        complete (bool): whether every chunk was received
+    """
+
+    status_code: int = 200
+    upload_id: str
+    filename: str
+    chunk_size: int
+    total_chunks: int
+    received_chunks: List[List[int]]
+    missing_chunks: List[List[int]]
+    prefix_bytes: int
+    complete: bool
+
+# pylint: disable=too-few-public-methods
+class StatsResponse(BaseModel):
+    """
+    Response model for the `stats` API.
+
+    Attributes:
+        memory_rss_bytes (int): current resident memory of the service process
+        memory_peak_bytes (int): peak resident memory of the service process
+        guard_counters (dict): how often each generation guard fired
+        routing (dict): segments routed to the small and the large model and the compute saved
+    """
+
+    memory_rss_bytes: int
+    memory_peak_bytes: int
+    guard_counters: dict = {}
+    routing: dict = {}
+
 # pylint: disable=too-few-public-methods
 class HealthResponse(BaseModel):
     """
@@ -0,0 +1,121 @@
+"""Stub models without weights, used to run the service and its tooling on machines without a GPU"""
+
+import logging
+from time import sleep
+
+import librosa
+import numpy as np
+import pandas as pd
+
+from asr_inference_service.model import format_segments
+from asr_inference_service.profiles import DEFAULT_PROFILE
+
+logging.basicConfig(
+    format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO
+)
+
+
+class StubDiarizer:
+    """Diarizer that splits the audio into fixed length turns of alternating speakers"""
+
+    def __init__(self, segment_length: float = 5.0, num_speakers: int = 2) -> None:
+        """
+        Inputs:
+            segment_length (float): length of every turn in seconds
+            num_speakers (int): number of speakers the turns alternate between
+        """
+        self.segment_length = segment_length
+        self.num_speakers = num_speakers
+        logging.info("Stub diarizer loaded!")
+
+    def diarize(self, audio_filepath: str, hook=None, **hints) -> pd.DataFrame:
+        """
+        Diarize from audio_filepath to pandas dataframe with format:
+
+        ['start_time', 'end_time', 'speaker', 'text']
+        """
+        if isinstance(audio_filepath, np.ndarray):
+            duration = len(audio_filepath) / 16000
+        else:
+            duration = librosa.get_duration(path=audio_filepath)
+        num_speakers = hints.get('num_speakers') or self.num_speakers
+        starts = np.arange(0, duration, self.segment_length)
+
+        return pd.DataFrame(
+            [
+                [round(start, 3), round(min(start + self.segment_length, duration), 3),
+                 f"SPEAKER_{idx % num_speakers:02d}", '']
+                for idx, start in enumerate(starts)
+            ],
+            columns=['start_time', 'end_time', 'speaker', 'text'],
+        )
+
+
+class StubASRModel:
+    """Stand-in for ASRModelForInference that sleeps in proportion to the audio length"""
+
+    def __init__(self,
+                 sample_rate: int = 16000,
+                 timestamp_format: str = 'seconds',
+                 latency_per_second: float = 0.01,
+                 **kwargs) -> None:
+        """
+        Inputs:
+            sample_rate (int): the target sample rate in which the model accepts
+            timestamp_format (str): 'seconds' or 'minutes'
+            latency_per_second (float): seconds slept per second of audio in infer
+            kwargs: remaining ASRModelForInference arguments, ignored
+        """
+        self.target_sr = sample_rate
+        self.timestamp_format = timestamp_format if timestamp_format in ['minutes', 'seconds'] else 'seconds'
+        self.latency_per_second = latency_per_second
+        self.diar_model = StubDiarizer()
+        logging.info("Stub ASR model loaded! Latency per second of audio: %s", self.latency_per_second)
+
+    def load_audio(self, audio_filepath: str) -> np.ndarray:
+        """Method to load an audio filepath at the target sample rate"""
+        if isinstance(audio_filepath, np.ndarray):
+            return audio_filepath
+
+        waveform, _ = librosa.load(audio_filepath, sr=self.target_sr, mono=True)
+
+        return waveform
+
+    def infer(self, waveform: np.ndarray, input_sr: int, profile: str = DEFAULT_PROFILE) -> str:
+        """Method to fake inference on a waveform, the text only reports the duration"""
+        duration = len(waveform) / input_sr
+        sleep(duration * self.latency_per_second)
+
+        return f" stub transcription of {duration:.2f}s of audio"
+
+    def diar_inference(self, filepath: str, progress_callback=None, profile: str = DEFAULT_PROFILE, **hints) -> str:
+        """Method to fake diarization and transcription of an audio file"""
+        segments = self.diar_model.diarize(filepath, **hints)
+        waveform = self.load_audio(filepath)
+        texts = []
+
+        for x in range(len(segments)):
+            if progress_callback is not None:
+                progress_callback("Transcription", x, len(segments))
+
+            start_frame = int(segments["start_time"][x] * self.target_sr)
+            end_frame = int(segments["end_time"][x] * self.target_sr)
+            texts.append(self.infer(waveform[start_frame:end_frame], self.target_sr, profile))
+
+        segments["text"] = texts
+
+        return format_segments(segments, self.timestamp_format)
+
+
+class StubDenoiser:
+    """Stand-in for DENOISER that returns the audio unchanged"""
+
+    def __init__(self, sample_rate: int = 16000, **kwargs) -> None:
+        self.sample_rate = sample_rate
+        logging.info("Stub denoiser loaded!")
+
+    def denoise(self, input_audio_filepath: str) -> np.ndarray:
+        """Method to fake denoising, returns the mono waveform at the target sample rate"""
+        waveform, _ = librosa.load(input_audio_filepath, sr=self.sample_rate, mono=True)
+
+        return waveform
@@ -0,0 +1,196 @@
+"""Transcription workflow shared by the Gradio app and the batch runner"""
+
+import os
+from datetime import datetime
+
+import librosa
+
+from asr_inference_service.profiles import DEFAULT_PROFILE
+from utils.audio_preprocessing import COMPRESSED_EXTENSIONS, decode_audio_ffmpeg
+from utils.utils import (
+    convert_diar_string_to_list,
+    convert_list_of_timestamps_to_seconds,
+    convert_to_seconds,
+    get_most_frequent_speaker,
+    get_number_of_speakers,
+    get_timestamps_for_speaker,
+    get_timestamps_for_speaker_timestamps,
+    get_zoom_cues,
+    replacement_of_string_in_text,
+)
+
+
+def run_transcription(model, audio_filepath, file_input=None, speaker=None, zoom_aligned=False, track_filepaths=None,
+                      profile=DEFAULT_PROFILE, offset_sec=1.5, end_offset_sec=240, progress_callback=None,
+                      multitrack_workers=4):
+    """
+    Overall Transcription logic, chaining all functionalities tgt:
+
+    1. Loads audio in and resamples
+    2. Handles if there is a specific speaker to focus on
+    3. Handles diarization (or Zoom-aligned segmentation) and transcription calls to the model
+    4. Returns the transcription
+
+    Per-participant tracks, if given, are transcribed directly without diarization.
+    """
+
+    if track_filepaths:
+        # Each track is one speaker, labelled with the track's file name
+        tracks = {
+            os.path.splitext(os.path.basename(track_filepath))[0]: track_filepath
+            for track_filepath in track_filepaths
+        }
+        return model.multitrack_inference(
+            tracks, num_workers=multitrack_workers, progress_callback=progress_callback, profile=profile
+        )
+
+    if audio_filepath == None:
+        return
+
+    if progress_callback:
+        progress_callback("Loading audio", 0, 1)
+
+    if str(audio_filepath).lower().endswith(COMPRESSED_EXTENSIONS):
+        # Streams compressed containers (m4a, mp4, mp3, ogg) through ffmpeg to 16kHz mono
+        y = decode_audio_ffmpeg(audio_filepath, model.target_sr)
+    else:
+        y, _ = librosa.load(audio_filepath, sr=model.target_sr, mono=True)
+
+    if zoom_aligned and file_input:
+        # Segments come straight from the Zoom transcript, no diarization or speaker mapping
+        return zoom_aligned_transcription(
+            model, y, file_input, speaker, profile, offset_sec, end_offset_sec, progress_callback
+        )
+
+    return diarized_transcription(
+        model, y, file_input, speaker, profile, offset_sec, end_offset_sec, progress_callback
+    )
+
+
+def zoom_aligned_transcription(model, y, file_input, speaker=None, profile=DEFAULT_PROFILE, offset_sec=1.5,
+                               end_offset_sec=240, progress_callback=None):
+    """
+    Transcribes the Zoom transcript's cues, restricted to the window of the chosen
+    interviewee if there is one
+    """
+    start_seconds, end_seconds = None, None
+
+    if speaker:
+        start, end, _ = get_timestamps_for_speaker_timestamps(speaker, file_input)
+        start_seconds = max(convert_to_seconds(start) - offset_sec, 0)
+        end_seconds = convert_to_seconds(end) + end_offset_sec
+
+    transcription = model.zoom_inference(
+        y, get_zoom_cues(file_input), start_seconds, end_seconds,
+        progress_callback=progress_callback, profile=profile,
+    )
+
+    if speaker:
+        transcription = (
+            f"Transcriptions for {speaker} as interviewee: \n\n" + transcription
+        )
+
+    return transcription
+
+
+def diarized_transcription(model, y, file_input=None, speaker=None, profile=DEFAULT_PROFILE, offset_sec=1.5,
+                           end_offset_sec=240, progress_callback=None):
+    """
+    Diarizes and transcribes the recording. With a chosen interviewee, only their window
+    of the Zoom transcript is transcribed and the diarized speakers are renamed after the
+    Zoom participants.
+    """
+
+    if not speaker:
+        # If Zoom transcript is not given, just dairization and transcription
+        # (a Zoom transcript without a chosen interviewee still gives the speaker count)
+
+        num_speakers = (
+            get_number_of_speakers(get_timestamps_for_speaker(file_input))
+            if file_input
+            else None
+        )
+
+        return model.diar_inference(
+            y, num_speakers=num_speakers, progress_callback=progress_callback, profile=profile
+        )
+
+    # If Zoom Transcript is given
+
+    matches = (
+        get_timestamps_for_speaker(file_input)
+    )
+
+    start, end, _ = get_timestamps_for_speaker_timestamps(speaker, file_input)
+
+    start_time = datetime.strptime(start, "%H:%M:%S.%f")
+    end_time = datetime.strptime(end, "%H:%M:%S.%f")
+
+    # Convert to total seconds
+    start_seconds = (
+        start_time.hour * 3600
+        + start_time.minute * 60
+        + start_time.second
+        + start_time.microsecond / 1_000_000
+    )
+    end_seconds = (
+        end_time.hour * 3600
+        + end_time.minute * 60
+        + end_time.second
+        + start_time.microsecond / 1_000_000
+    )
+
+    if start_seconds - offset_sec > 0:
+
+        start_seconds = start_seconds - offset_sec
+
+    start_timeframe, end_timeframe = (
+        start_seconds * model.target_sr,
+        end_seconds * model.target_sr,
+    )
+
+    if end_timeframe + end_offset_sec * model.target_sr <= len(y):
+
+        end_timeframe += end_offset_sec * model.target_sr
+
+    else:
+
+        end_timeframe = len(y)
+
+    print(f"Start timeframes ({model.target_sr}Hz) : {start_timeframe}")
+    print(f"End timeframes ({model.target_sr}Hz) : {end_timeframe}")
+
+    truncated_audio_array = y[int(start_timeframe) : int(end_timeframe)]
+
+    # Participants of the Zoom transcript in the window are used as a hint for diarization
+    num_speakers = get_number_of_speakers(
+        matches, start_seconds, end_timeframe / model.target_sr
+    )
+
+    transcription = model.diar_inference(
+        truncated_audio_array, num_speakers=num_speakers, progress_callback=progress_callback,
+        profile=profile,
+    )
+
+    average_actual_time_sec = convert_list_of_timestamps_to_seconds(
+        matches
+    )
+    transcription_time_segments = convert_diar_string_to_list(
+        transcription, start_seconds
+    )
+
+    speaker_chosen_list = get_most_frequent_speaker(
+        transcription_time_segments, average_actual_time_sec
+    )
+
+    for speaker_chosen in speaker_chosen_list:
+
+        transcription = replacement_of_string_in_text(
+            transcription, speaker_chosen, speaker_chosen_list[speaker_chosen]
+        )
+
+    transcription = (
+        f"Transcriptions for {speaker} as interviewee: \n\n" + transcription
+    )
+
+    return transcription
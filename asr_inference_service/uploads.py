@@ -0,0 +1,337 @@
+"""Disk spool for chunked, resumable uploads of long recordings"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import AsyncIterator, List
+
+logging.basicConfig(
+    format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO
+)
+
+
+# Smaller chunks make the received list (rewritten on every chunk) grow with the upload
+MIN_CHUNK_SIZE = 256 * 1024
+
+
+class UploadError(Exception):
+    """Raised for unknown uploads, invalid chunks and failed checksums"""
+
+
+def chunk_ranges(indices: List[int]) -> List[List[int]]:
+    """
+    Collapse sorted chunk indices into inclusive [first, last] ranges, e.g.
+    [0, 1, 2, 5, 7, 8] -> [[0, 2], [5, 5], [7, 8]]
+    """
+    ranges = []
+
+    for idx in indices:
+        if ranges and idx == ranges[-1][1] + 1:
+            ranges[-1][1] = idx
+        else:
+            ranges.append([idx, idx])
+
+    return ranges
+
+
+class PrefixReader(io.RawIOBase):
+    """Read-only view of the first `limit` bytes of a file, without a file descriptor
+    so decoders stream it instead of reading the whole file"""
+
+    def __init__(self, path: str, limit: int) -> None:
+        self.file = open(path, "rb")
+        self.remaining = limit
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self.remaining)
+
+        if size <= 0:
+            return 0
+
+        read = self.file.readinto(memoryview(buffer)[:size])
+        self.remaining -= read
+
+        return read
+
+    def close(self) -> None:
+        self.file.close()
+        super().close()
+
+
+class UploadSpool:
+    """Stores upload chunks straight into a file on disk, one directory per upload.
+    The list of received chunks is persisted so uploads resume across dropped
+    connections and service restarts. Uploads without activity for `ttl` seconds are
+    removed."""
+
+    def __init__(self,
+                 spool_dir: str,
+                 chunk_size: int = 8 * 1024 * 1024,
+                 max_chunk_size: int = 64 * 1024 * 1024,
+                 max_total_size: int = 20 * 1024**3,
+                 ttl: float = 24 * 3600.0) -> None:
+        """
+        Inputs:
+            spool_dir (str): directory the uploads are written to
+            chunk_size (int): default chunk size in bytes
+            max_chunk_size (int): largest chunk size a client can ask for
+            max_total_size (int): largest upload accepted in bytes
+            ttl (float): seconds after the last chunk (or creation) an unfinished upload is removed
+        """
+        if not MIN_CHUNK_SIZE <= chunk_size <= max_chunk_size:
+            raise ValueError(f"chunk_size must be between {MIN_CHUNK_SIZE} and {max_chunk_size} bytes.")
+
+        self.spool_dir = spool_dir
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.max_total_size = max_total_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+        logging.info(
+            "Upload spool: %s, chunk size: %s, max upload size: %s, ttl: %ss",
+            self.spool_dir,
+            self.chunk_size,
+            self.max_total_size,
+            self.ttl,
+        )
+        self.sweep()
+
+    def upload_dir(self, upload_id: str) -> str:
+        """Directory of an upload, rejects ids that are not ours"""
+        try:
+            upload_id = uuid.UUID(upload_id).hex
+        except ValueError:
+            raise UploadError(f"Unknown upload {upload_id}.")
+
+        path = os.path.join(self.spool_dir, upload_id)
+
+        if not os.path.isdir(path):
+            raise UploadError(f"Unknown upload {upload_id}.")
+
+        return path
+
+    def data_path(self, upload_id: str) -> str:
+        """Path of the spooled file of an upload"""
+        return os.path.join(self.upload_dir(upload_id), "data")
+
+    def read_meta(self, upload_id: str) -> dict:
+        """Metadata of an upload (sizes, checksum and received chunks)"""
+        with open(os.path.join(self.upload_dir(upload_id), "meta.json")) as meta_file:
+            return json.load(meta_file)
+
+    def write_meta(self, upload_id: str, meta: dict) -> None:
+        """Atomically replace the metadata of an upload"""
+        meta_path = os.path.join(self.upload_dir(upload_id), "meta.json")
+
+        with open(f"{meta_path}.tmp", "w") as meta_file:
+            json.dump(meta, meta_file)
+
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def create(self, filename: str, total_size: int, chunk_size: int = None, sha256: str = None) -> dict:
+        """Method to initialise an upload
+
+        Inputs:
+            filename (str): original file name, its extension decides how the file is decoded
+            total_size (int): size of the whole file in bytes
+            chunk_size (int): size of every chunk but the last, defaults to the spool's chunk size
+            sha256 (str): optional checksum of the whole file, verified on finalise
+
+        Returns:
+            status (dict): see status
+        """
+        chunk_size = chunk_size or self.chunk_size
+
+        if not 0 < total_size <= self.max_total_size:
+            raise UploadError(f"total_size must be between 1 and {self.max_total_size} bytes.")
+
+        if not MIN_CHUNK_SIZE <= chunk_size <= self.max_chunk_size:
+            raise UploadError(f"chunk_size must be between {MIN_CHUNK_SIZE} and {self.max_chunk_size} bytes.")
+
+        # Abandoned uploads are cleared before the spool takes a new one
+        self.sweep()
+
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.spool_dir, upload_id))
+        open(os.path.join(self.spool_dir, upload_id, "data"), "wb").close()
+
+        self.write_meta(upload_id, {
+            "upload_id": upload_id,
+            "filename": filename,
+            "total_size": total_size,
+            "chunk_size": chunk_size,
+            "total_chunks": -(-total_size // chunk_size),
+            "sha256": sha256,
+            "received_chunks": [],
+        })
+        logging.info("Upload %s created for %s (%s bytes)", upload_id, filename, total_size)
+
+        return self.status(upload_id)
+
+    def status(self, upload_id: str) -> dict:
+        """Method to report the received and missing chunks as inclusive [first, last]
+        ranges, used to resume an upload"""
+        meta = self.read_meta(upload_id)
+        received = set(meta["received_chunks"])
+
+        return {
+            "upload_id": meta["upload_id"],
+            "filename": meta["filename"],
+            "chunk_size": meta["chunk_size"],
+            "total_chunks": meta["total_chunks"],
+            "received_chunks": chunk_ranges(sorted(received)),
+            "missing_chunks": chunk_ranges(
+                [idx for idx in range(meta["total_chunks"]) if idx not in received]
+            ),
+            "prefix_bytes": self.prefix_bytes(meta),
+            "complete": len(received) == meta["total_chunks"],
+        }
+
+    @staticmethod
+    def prefix_bytes(meta: dict) -> int:
+        """Number of contiguous bytes received from the start of the file"""
+        received = set(meta["received_chunks"])
+        idx = 0
+
+        while idx in received:
+            idx += 1
+
+        return min(idx * meta["chunk_size"], meta["total_size"])
+
+    async def write_chunk(self, upload_id: str, index: int, stream: AsyncIterator[bytes], sha256: str = None) -> dict:
+        """Method to write one chunk at its offset in the spooled file, streamed from the
+        request body so memory stays flat
+
+        Inputs:
+            upload_id (str): id returned by create
+            index (int): chunk number, starting at 0
+            stream (AsyncIterator[bytes]): body of the request
+            sha256 (str): optional checksum of the chunk, the chunk is rejected on mismatch
+
+        Returns:
+            status (dict): see status
+        """
+        meta = self.read_meta(upload_id)
+
+        if not 0 <= index < meta["total_chunks"]:
+            raise UploadError(f"Chunk {index} is out of range (0 to {meta['total_chunks'] - 1}).")
+
+        # A chunk sent again is only counted once it has been written and verified again
+        self.mark_chunk(upload_id, index, received=False)
+
+        expected_size = min(meta["chunk_size"], meta["total_size"] - index * meta["chunk_size"])
+        digest = hashlib.sha256()
+        written = 0
+
+        with open(self.data_path(upload_id), "r+b") as data_file:
+            data_file.seek(index * meta["chunk_size"])
+
+            async for body_chunk in stream:
+                written += len(body_chunk)
+
+                if written > expected_size:
+                    raise UploadError(f"Chunk {index} is larger than {expected_size} bytes.")
+
+                digest.update(body_chunk)
+                data_file.write(body_chunk)
+
+        if written != expected_size:
+            raise UploadError(f"Chunk {index} has {written} bytes, expected {expected_size}.")
+
+        if sha256 and digest.hexdigest() != sha256.lower():
+            raise UploadError(f"Checksum mismatch for chunk {index}.")
+
+        self.mark_chunk(upload_id, index, received=True)
+
+        return self.status(upload_id)
+
+    def mark_chunk(self, upload_id: str, index: int, received: bool) -> None:
+        """Add or remove a chunk from the received list, chunks of the same upload can arrive concurrently"""
+        with self.lock:
+            meta = self.read_meta(upload_id)
+            received_chunks = set(meta["received_chunks"])
+
+            if received:
+                received_chunks.add(index)
+            else:
+                received_chunks.discard(index)
+
+            meta["received_chunks"] = sorted(received_chunks)
+            self.write_meta(upload_id, meta)
+
+    def open_prefix(self, upload_id: str) -> PrefixReader:
+        """Method to open the contiguous received prefix of an upload for processing
+        before the upload is complete"""
+        meta = self.read_meta(upload_id)
+
+        return PrefixReader(self.data_path(upload_id), self.prefix_bytes(meta))
+
+    def finalise(self, upload_id: str) -> str:
+        """Method to check that every chunk arrived and the whole-file checksum matches
+
+        Returns:
+            data_path (str): path of the complete spooled file
+        """
+        status = self.status(upload_id)
+
+        if not status["complete"]:
+            raise UploadError(f"Upload is missing chunks {status['missing_chunks']}.")
+
+        meta = self.read_meta(upload_id)
+        # Keeps the sweep away from an upload while it is being transcribed
+        os.utime(os.path.join(self.upload_dir(upload_id), "meta.json"))
+
+        if meta["sha256"]:
+            digest = hashlib.sha256()
+
+            with open(self.data_path(upload_id), "rb") as data_file:
+                while block := data_file.read(self.chunk_size):
+                    digest.update(block)
+
+            if digest.hexdigest() != meta["sha256"].lower():
+                raise UploadError("Checksum mismatch for the whole file.")
+
+        return self.data_path(upload_id)
+
+    def delete(self, upload_id: str) -> None:
+        """Method to remove an upload from the spool"""
+        shutil.rmtree(self.upload_dir(upload_id), ignore_errors=True)
+
+    def sweep(self) -> List[str]:
+        """Method to remove the uploads without activity for longer than the ttl, the
+        metadata is rewritten on every chunk so its modification time is the last activity
+
+        Returns:
+            removed (list): ids of the removed uploads
+        """
+        cutoff = time.time() - self.ttl
+        removed = []
+
+        for upload_id in os.listdir(self.spool_dir):
+            upload_dir = os.path.join(self.spool_dir, upload_id)
+
+            try:
+                last_activity = os.path.getmtime(os.path.join(upload_dir, "meta.json"))
+            except OSError:
+                # Directory created but no metadata written yet
+                last_activity = os.path.getmtime(upload_dir)
+
+            if last_activity < cutoff:
+                shutil.rmtree(upload_dir, ignore_errors=True)
+                removed.append(upload_id)
+
+        if removed:
+            logging.info("Removed %s abandoned uploads: %s", len(removed), removed)
+
+        return removed
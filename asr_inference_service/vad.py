@@ -0,0 +1,231 @@
+"""Energy based Voice Activity Detection used to trim silence and align Zoom transcripts"""
+
+import logging
+from typing import List, Tuple
+
+import numpy as np
+
+logging.basicConfig(
+    format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO
+)
+
+
+class EnergyVAD:
+    """Frame energy VAD that removes long non-speech spans from a waveform"""
+
+    def __init__(self,
+                 threshold_db: float = -45.0,
+                 floor_db: float = -60.0,
+                 min_trim_length: float = 2.0,
+                 padding: float = 0.25,
+                 frame_length: float = 0.03) -> None:
+        """Method to initialise the VAD
+
+        Inputs:
+            threshold_db (float): frames quieter than (loudest frame + threshold_db) are non-speech
+            floor_db (float): frames quieter than this absolute level (dBFS) are always
+                non-speech, so recordings without any speech are not kept whole
+            min_trim_length (float): only non-speech spans longer than this (seconds) are removed
+            padding (float): seconds of non-speech kept on each side of a removed span
+            frame_length (float): analysis frame length in seconds
+        """
+        self.threshold_db = threshold_db
+        self.floor_db = floor_db
+        self.min_trim_length = min_trim_length
+        self.padding = padding
+        self.frame_length = frame_length
+
+        logging.info(
+            "Energy VAD threshold: %s dB, floor: %s dB, Minimum Trim Length: %s, Padding: %s",
+            self.threshold_db,
+            self.floor_db,
+            self.min_trim_length,
+            self.padding,
+        )
+
+    def frame_energy(self, waveform: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Method to compute the energy (in dB) of non-overlapping frames
+
+        Inputs:
+            waveform (np.ndarray): waveform of shape (T,)
+            sample_rate (int): sample rate of the waveform
+
+        Returns:
+            energy (np.ndarray): energy in dB of shape (T // frame_samples,)
+        """
+        frame_samples = max(int(self.frame_length * sample_rate), 1)
+        n_frames = len(waveform) // frame_samples
+
+        frames = np.asarray(
+            waveform[: n_frames * frame_samples], dtype=np.float32
+        ).reshape(n_frames, frame_samples)
+
+        return 10 * np.log10(np.mean(frames**2, axis=1) + 1e-10)
+
+    def speech_threshold(self, energy: np.ndarray) -> float:
+        """Method to get the energy (in dB) below which a frame is non-speech, relative to
+        the loudest frame but never below the absolute floor
+
+        Inputs:
+            energy (np.ndarray): frame energies in dB
+
+        Returns:
+            threshold (float): speech threshold in dB
+        """
+        return max(energy.max() + self.threshold_db, self.floor_db)
+
+    def speech_regions(self, waveform: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Method to find the regions of the waveform to keep, i.e. everything except
+        non-speech spans longer than min_trim_length
+
+        Inputs:
+            waveform (np.ndarray): waveform of shape (T,)
+            sample_rate (int): sample rate of the waveform
+
+        Returns:
+            regions (np.ndarray): [start_sample, end_sample) pairs of shape (N, 2)
+        """
+        frame_samples = max(int(self.frame_length * sample_rate), 1)
+        energy = self.frame_energy(waveform, sample_rate)
+
+        if len(energy) == 0:
+            return np.array([[0, len(waveform)]], dtype=np.int64)
+
+        is_silence = energy < self.speech_threshold(energy)
+
+        # Boundaries of runs of silent frames
+        edges = np.diff(np.concatenate(([0], is_silence.astype(np.int8), [0])))
+        silence_starts = np.flatnonzero(edges == 1) * frame_samples
+        silence_ends = np.flatnonzero(edges == -1) * frame_samples
+
+        # The trailing partial frame belongs to the last run
+        silence_ends[silence_ends == len(energy) * frame_samples] = len(waveform)
+
+        min_trim_samples = int(self.min_trim_length * sample_rate)
+        padding_samples = int(self.padding * sample_rate)
+
+        long_spans = (silence_ends - silence_starts) >= min_trim_samples
+        cut_starts = silence_starts[long_spans] + padding_samples
+        cut_ends = silence_ends[long_spans] - padding_samples
+
+        # Do not pad into the edges of the recording
+        cut_starts[silence_starts[long_spans] == 0] = 0
+        cut_ends[silence_ends[long_spans] == len(waveform)] = len(waveform)
+
+        valid = cut_ends > cut_starts
+        cut_starts, cut_ends = cut_starts[valid], cut_ends[valid]
+
+        # Kept regions are the complement of the cuts
+        region_starts = np.concatenate(([0], cut_ends))
+        region_ends = np.concatenate((cut_starts, [len(waveform)]))
+        regions = np.stack((region_starts, region_ends), axis=1).astype(np.int64)
+
+        return regions[regions[:, 1] > regions[:, 0]]
+
+    @staticmethod
+    def compact(waveform: np.ndarray, regions: np.ndarray) -> np.ndarray:
+        """Method to concatenate the kept regions into a single waveform
+
+        Inputs:
+            waveform (np.ndarray): waveform of shape (T,)
+            regions (np.ndarray): [start_sample, end_sample) pairs of shape (N, 2)
+
+        Returns:
+            compacted (np.ndarray): waveform with only the kept regions
+        """
+        if len(regions) == 0:
+            return waveform[:0]
+
+        return np.concatenate([waveform[start:end] for start, end in regions])
+
+    @staticmethod
+    def restore_timestamps(turns: List[Tuple[float, float, str]],
+                           regions: np.ndarray,
+                           sample_rate: int) -> List[Tuple[float, float, str]]:
+        """Method to map turns on the compacted timeline back to the original timeline.
+        Turns crossing a removed span are split at the cut.
+
+        Inputs:
+            turns (list): (start, end, speaker) in seconds on the compacted timeline
+            regions (np.ndarray): [start_sample, end_sample) pairs used for compaction
+            sample_rate (int): sample rate of the waveform
+
+        Returns:
+            restored (list): (start, end, speaker) in seconds on the original timeline
+        """
+        if len(regions) == 0:
+            return []
+
+        lengths = regions[:, 1] - regions[:, 0]
+        compact_starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) / sample_rate
+        compact_ends = compact_starts + lengths / sample_rate
+        original_starts = regions[:, 0] / sample_rate
+
+        restored = []
+
+        for start, end, speaker in turns:
+            first = max(np.searchsorted(compact_ends, start, side="right"), 0)
+            last = min(np.searchsorted(compact_starts, end, side="left"), len(regions))
+
+            for idx in range(first, last):
+                piece_start = max(start, compact_starts[idx])
+                piece_end = min(end, compact_ends[idx])
+
+                if piece_end <= piece_start:
+                    continue
+
+                shift = original_starts[idx] - compact_starts[idx]
+                restored.append(
+                    (float(piece_start + shift), float(piece_end + shift), speaker)
+                )
+
+        return restored
+
+    def estimate_offset(self,
+                        waveform: np.ndarray,
+                        sample_rate: int,
+                        cues: List[Tuple[float, float, str]],
+                        max_offset: float = 30.0) -> float:
+        """Method to estimate the clock offset between transcript cues and the audio by
+        cross-correlating cue activity with the audio energy envelope
+
+        Inputs:
+            waveform (np.ndarray): waveform of shape (T,)
+            sample_rate (int): sample rate of the waveform
+            cues (list): (start, end, speaker) in seconds on the transcript clock
+            max_offset (float): largest offset (seconds) searched in either direction
+
+        Returns:
+            offset (float): seconds to add to cue times to land on the audio timeline
+        """
+        energy = self.frame_energy(waveform, sample_rate)
+
+        if len(energy) == 0 or len(cues) == 0:
+            return 0.0
+
+        audio_activity = (energy >= self.speech_threshold(energy)).astype(np.float32)
+
+        cue_activity = np.zeros_like(audio_activity)
+        for start, end, _ in cues:
+            first = max(int(start / self.frame_length), 0)
+            last = min(int(np.ceil(end / self.frame_length)), len(cue_activity))
+            cue_activity[first:last] = 1.0
+
+        audio_activity -= audio_activity.mean()
+        cue_activity -= cue_activity.mean()
+
+        # Circular cross-correlation without wrap around, index k is a lag of k frames
+        n_fft = 2 ** int(np.ceil(np.log2(2 * len(energy))))
+        correlation = np.fft.irfft(
+            np.fft.rfft(audio_activity, n_fft) * np.conj(np.fft.rfft(cue_activity, n_fft)),
+            n_fft,
+        )
+
+        max_lag = min(int(max_offset / self.frame_length), len(energy) - 1)
+        lags = np.arange(-max_lag, max_lag + 1)
+        best_lag = lags[np.argmax(correlation[lags])]
+
+        offset = float(best_lag * self.frame_length)
+        logging.info("Estimated transcript to audio offset: %.2fs", offset)
+
+        return offset
@@ -1,33 +1,31 @@
 import os
-import tempfile
-from datetime import datetime
+import threading
 
 import gradio as gr
-import librosa
-import soundfile as sf
 
+from asr_inference_service.config import model_kwargs_from_env
 from asr_inference_service.model import ASRModelForInference
-from utils.audio_preprocessing import resample_audio_array
+from asr_inference_service.profiles import DECODING_PROFILES, DEFAULT_PROFILE, profile_workers
+from asr_inference_service.transcription import run_transcription
 from utils.utils import (
-    convert_diar_string_to_list,
-    convert_list_of_timestamps_to_seconds,
-    get_most_frequent_speaker,
     get_speakers_names,
-    get_timestamps_for_speaker,
-    replacement_of_string_in_text,
     get_timestamps_for_speaker_timestamps
 )
 
-model = ASRModelForInference(
-    model_dir=os.environ["PRETRAINED_MODEL_DIR"],
-    sample_rate=int(os.environ["SAMPLE_RATE"]),
-    device=os.environ["DEVICE"],
-    timestamp_format=os.environ["TIMESTAMPS_FORMAT"],
-    min_segment_length=float(os.environ["MIN_SEGMENT_LENGTH"]),
-    min_silence_length=float(os.environ["MIN_SILENCE_LENGTH"]),
-)
+model = ASRModelForInference(**model_kwargs_from_env())
+
+MULTITRACK_WORKERS = int(os.environ.get("MULTITRACK_WORKERS", 4))
 
-SAMPLE_RATE = int(os.environ["SAMPLE_RATE"])
+# Queue settings, every decoding profile has its own transcription queue
+# separate from the lightweight events
+DEFAULT_CONCURRENCY_LIMIT = int(os.environ.get("GRADIO_DEFAULT_CONCURRENCY_LIMIT", 4))
+PROFILE_WORKERS = profile_workers(os.environ.get("PROFILE_WORKERS"))
+MAX_QUEUE_SIZE = int(os.environ["GRADIO_MAX_QUEUE_SIZE"]) if os.environ.get("GRADIO_MAX_QUEUE_SIZE") else None
+
+# Cancellation flags of the running transcriptions, per Gradio session. Entries are
+# removed when the transcription ends so finished sessions do not accumulate
+CANCEL_EVENTS = {}
+CANCEL_EVENTS_LOCK = threading.Lock()
 
 default_download_button = gr.DownloadButton(label="Load the .txt file to download", value=None)
 
@@ -50,109 +48,55 @@ def timestamp_logic(file_input, speaker: str):
     return final_string
 
 
-def transcription_logic(audio_filepath, file_input=None, speaker=None, offset_sec=1.5, end_offset_sec=240):
+class TranscriptionCancelled(Exception):
     """
-    Overall Transcription logic, chaining all functionalities tgt:
-
-    1. Loads audio in and resamples
-    2. Handles if there is a specific speaker to focus on
-    3. Handles diarization and transcription calls to the model
-    4. Returns the transcription
-
+    Raised from the progress callback once the user cancels the transcription
     """
-    
-    if audio_filepath == None:
-        return
-
-    data, samplerate = librosa.load(audio_filepath)
-
-    y = resample_audio_array(data, samplerate, SAMPLE_RATE)
-
-    if speaker:
-        # If Zoom Transcript is given
-
-        matches = (
-            get_timestamps_for_speaker(file_input)
-        )
-        
-        start, end, _ = get_timestamps_for_speaker_timestamps(speaker, file_input)
-        
-        start_time = datetime.strptime(start, "%H:%M:%S.%f")
-        end_time = datetime.strptime(end, "%H:%M:%S.%f")
-
-        # Convert to total seconds
-        start_seconds = (
-            start_time.hour * 3600
-            + start_time.minute * 60
-            + start_time.second
-            + start_time.microsecond / 1_000_000
-        )
-        end_seconds = (
-            end_time.hour * 3600
-            + end_time.minute * 60
-            + end_time.second
-            + start_time.microsecond / 1_000_000
-        )
-
-        if start_seconds - offset_sec > 0:
-
-            start_seconds = start_seconds - offset_sec
-
-        start_timeframe, end_timeframe = (
-            start_seconds * SAMPLE_RATE,
-            end_seconds * SAMPLE_RATE,
-        )
-        
-        if end_timeframe + end_offset_sec * SAMPLE_RATE <= len(y):
-            
-            end_timeframe += end_offset_sec * SAMPLE_RATE
-        
-        else:
-            
-            end_timeframe = len(y)
-
-        print(f"Start timeframes ({SAMPLE_RATE}Hz) : {start_timeframe}")
-        print(f"End timeframes ({SAMPLE_RATE}Hz) : {end_timeframe}")
-
-        truncated_audio_array = y[int(start_timeframe) : int(end_timeframe)]
-        with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as temp_file:
-
-            sf.write(temp_file, truncated_audio_array, SAMPLE_RATE)
-            temp_file_path = temp_file.name
 
-            transcription = model.diar_inference(temp_file_path)
 
-        average_actual_time_sec = convert_list_of_timestamps_to_seconds(
-            matches
-        )
-        transcription_time_segments = convert_diar_string_to_list(
-            transcription, start_seconds
-        )
-
-        speaker_chosen_list = get_most_frequent_speaker(
-            transcription_time_segments, average_actual_time_sec
-        )
-        
-        for speaker_chosen in speaker_chosen_list:
-
-            transcription = replacement_of_string_in_text(
-                transcription, speaker_chosen, speaker_chosen_list[speaker_chosen]
-            )
-            
-        transcription = (
-            f"Transcriptions for {speaker} as interviewee: \n\n" + transcription
+def transcription_logic(audio_filepath, file_input=None, speaker=None, zoom_aligned=False, track_filepaths=None,
+                        profile=DEFAULT_PROFILE, request: gr.Request = None, progress=gr.Progress()):
+    """
+    Gradio entry point for transcription, reports progress per stage and per segment
+    and stops between steps once the cancel button is pressed
+    """
+    cancel_event = threading.Event()
+    session_hash = request.session_hash if request is not None else None
+    if session_hash is not None:
+        with CANCEL_EVENTS_LOCK:
+            CANCEL_EVENTS.setdefault(session_hash, set()).add(cancel_event)
+
+    def progress_callback(stage, completed, total):
+        if cancel_event.is_set():
+            raise TranscriptionCancelled(stage)
+        progress((completed, total), desc=stage)
+
+    try:
+        return run_transcription(
+            model, audio_filepath, file_input, speaker, zoom_aligned, track_filepaths,
+            profile=profile, progress_callback=progress_callback, multitrack_workers=MULTITRACK_WORKERS,
         )
+    except TranscriptionCancelled as cancelled:
+        print(f"Transcription cancelled during: {cancelled}")
+        return "Transcription cancelled."
+    finally:
+        if session_hash is not None:
+            with CANCEL_EVENTS_LOCK:
+                CANCEL_EVENTS[session_hash].discard(cancel_event)
+                if not CANCEL_EVENTS[session_hash]:
+                    del CANCEL_EVENTS[session_hash]
+
+
+def cancel_logic(request: gr.Request):
+    """
+    Flags the running transcriptions of this session to stop at the next step
+    """
+    if request is None:
+        return
 
-    else:
-        # If Zoom transcript is not given, just dairization and transcription
-
-        with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as temp_file:
-
-            sf.write(temp_file, y, SAMPLE_RATE)
-            temp_file_path = temp_file.name
-            transcription = model.diar_inference(temp_file_path)
-
-    return transcription
+    with CANCEL_EVENTS_LOCK:
+        for cancel_event in CANCEL_EVENTS.get(request.session_hash, ()):
+            cancel_event.set()
 
 
 def download_logic(transcription, speaker_choice = None, download_button = gr.DownloadButton()):
@@ -179,6 +123,12 @@ def download_logic(transcription, speaker_choice = None, download_button = gr.Do
     
     return download_button
 
+def show_profile_button(profile):
+    '''
+    Shows the transcribe button of the chosen decoding profile, every button feeds its own queue
+    '''
+    return [gr.Button(visible=name == profile) for name in DECODING_PROFILES]
+
 def reset_download_button():
     '''
     When audio file is uploaded, reset the download button
@@ -199,14 +149,34 @@ with gr.Blocks() as demo:
 
         with gr.Column(0):
 
-            audio_input = gr.Audio(label="Audio Clip", type="filepath")
+            # format=None keeps the uploaded container (e.g. Zoom's m4a) instead of converting to wav
+            audio_input = gr.Audio(label="Audio Clip", type="filepath", format=None)
+            track_input = gr.File(
+                label="Per-participant Audio Tracks (optional, replaces Audio Clip)",
+                file_count="multiple",
+                type="filepath",
+            )
 
             file_input = gr.File(label="Zoom Transcript")
             speaker_choice = gr.Radio([], label="Choose Interviewee: ")
+            zoom_aligned_choice = gr.Checkbox(
+                label="Use Zoom transcript timings (skip diarization)"
+            )
+            
+            profile_choice = gr.Dropdown(
+                list(DECODING_PROFILES),
+                value=DEFAULT_PROFILE,
+                label="Decoding Profile (draft is fastest, archival is most accurate)",
+            )
             
-            transcribe_button = gr.Button("Start Transcription!")
+            transcribe_buttons = {
+                name: gr.Button("Start Transcription!", visible=name == DEFAULT_PROFILE)
+                for name in DECODING_PROFILES
+            }
+            cancel_button = gr.Button("Cancel Transcription", variant="stop")
 
             file_input.change(get_speakers_names, file_input, speaker_choice)
+            profile_choice.change(show_profile_button, profile_choice, list(transcribe_buttons.values()))
 
         with gr.Column(1):
 
@@ -218,10 +188,19 @@ with gr.Blocks() as demo:
                 timestamp_logic, [file_input, speaker_choice], timestamps_outputs
             )
             
-            transcribe_button.click(
-                transcription_logic,
-                [audio_input, file_input, speaker_choice],
-                transcript_outputs,
+            # Drafts are not queued behind archival runs
+            transcribe_events = [
+                transcribe_button.click(
+                    transcription_logic,
+                    [audio_input, file_input, speaker_choice, zoom_aligned_choice, track_input, profile_choice],
+                    transcript_outputs,
+                    concurrency_limit=PROFILE_WORKERS[name],
+                    concurrency_id=f"transcription_{name}",
+                )
+                for name, transcribe_button in transcribe_buttons.items()
+            ]
+            cancel_button.click(
+                cancel_logic, None, None, cancels=transcribe_events, queue=False
             )
             
             download_button = gr.DownloadButton(label="Load the .txt file to download", value=None)
@@ -233,6 +212,11 @@ with gr.Blocks() as demo:
                 download_button
             )
 
+demo.queue(
+    default_concurrency_limit=DEFAULT_CONCURRENCY_LIMIT,
+    max_size=MAX_QUEUE_SIZE,
+)
+
 
 if __name__ == "__main__":
 
@@ -0,0 +1,164 @@
+import threading
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from asr_inference_service import coordinator  # noqa: E402
+from asr_inference_service.coordinator import (  # noqa: E402
+    Backend,
+    ShardingCoordinator,
+    parse_backends,
+)
+
+
+class Clock:
+    """Stands in for time.monotonic"""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(coordinator, "monotonic", clock)
+
+    return clock
+
+
+def make_coordinator(*concurrencies, **kwargs) -> ShardingCoordinator:
+    backends = [Backend(f"http://node{idx}:8080", limit) for idx, limit in enumerate(concurrencies)]
+
+    return ShardingCoordinator(backends, diarizer=None, **kwargs)
+
+
+def test_parse_backends():
+    backends = parse_backends(" http://node1:8080/|4, ,http://node2:8080", default_concurrency=2)
+
+    assert [(backend.url, backend.max_concurrency) for backend in backends] == [
+        ("http://node1:8080", 4),
+        ("http://node2:8080", 2),
+    ]
+
+
+def test_no_backends():
+    with pytest.raises(ValueError):
+        ShardingCoordinator([], diarizer=None)
+
+
+def test_acquire_prefers_least_loaded_then_fewest_failures(clock):
+    sharding = make_coordinator(2, 2, 4)
+    first, second, third = sharding.backends
+    first.failures = 1
+
+    # Equal load, the backend without failures wins, ties keep the configured order
+    assert sharding.acquire_backend(set()) is second
+    assert sharding.acquire_backend(set()) is third
+    assert sharding.acquire_backend(set()) is first
+    # node2 is at 1/4, the others at 1/2
+    assert sharding.acquire_backend(set()) is third
+    assert [backend.in_flight for backend in sharding.backends] == [1, 1, 2]
+
+
+def test_acquire_avoids_excluded_unless_nothing_else_is_free(clock):
+    sharding = make_coordinator(1, 1)
+    first, second = sharding.backends
+
+    assert sharding.acquire_backend({first.url}) is second
+    # The only free slot is on an excluded backend, it is used rather than waiting
+    assert sharding.acquire_backend({first.url}) is first
+
+
+def test_acquire_waits_for_a_released_slot(clock):
+    sharding = make_coordinator(1)
+    backend = sharding.acquire_backend(set())
+    latency = 0.5
+    acquired = []
+
+    waiter = threading.Thread(target=lambda: acquired.append(sharding.acquire_backend(set())))
+    waiter.start()
+    waiter.join(timeout=0.1)
+    assert waiter.is_alive() and not acquired
+
+    sharding.release_backend(backend, latency=latency)
+    waiter.join(timeout=5)
+
+    assert acquired == [backend]
+    assert backend.completed == 1 and backend.average_latency == latency
+
+
+def test_circuit_breaker_opens_after_consecutive_failures_and_closes_after_cooldown(clock):
+    threshold = 2
+    sharding = make_coordinator(4, 4, failure_threshold=threshold, cooldown=30.0)
+    flaky, healthy = sharding.backends
+
+    for _ in range(threshold):
+        sharding.release_backend(sharding.acquire_backend({healthy.url}))
+
+    assert flaky.failures == threshold and flaky.is_open(clock.now)
+    assert healthy.in_flight == 0
+    # Skipped even though it is the only backend not excluded
+    assert sharding.acquire_backend({healthy.url}) is healthy
+
+    clock.now += 31.0
+    assert sharding.acquire_backend({healthy.url}) is flaky
+
+    # Still past the threshold, one more failure reopens it straight away
+    sharding.release_backend(flaky)
+    assert flaky.is_open(clock.now)
+
+
+def test_success_resets_consecutive_failures(clock):
+    sharding = make_coordinator(1, failure_threshold=2)
+    backend = sharding.backends[0]
+
+    sharding.release_backend(sharding.acquire_backend(set()))
+    sharding.release_backend(sharding.acquire_backend(set()), latency=0.1)
+    sharding.release_backend(sharding.acquire_backend(set()))
+
+    assert backend.failures == sharding.failure_threshold
+    assert backend.consecutive_failures == 1
+    assert not backend.is_open(clock.now)
+
+
+def test_transcribe_segment_retries_on_another_backend(clock, monkeypatch):
+    sharding = make_coordinator(1, 1, retries=3)
+    first, second = sharding.backends
+    sleeps = []
+    monkeypatch.setattr(coordinator, "sleep", sleeps.append)
+
+    def request_transcription(backend, waveform):
+        if backend is first:
+            raise ConnectionError("refused")
+        return "hello"
+
+    monkeypatch.setattr(sharding, "request_transcription", request_transcription)
+    # Make node0 the first pick
+    second.failures = 1
+
+    assert sharding.transcribe_segment(None) == "hello"
+    assert sleeps == [0.5]
+    assert first.failures == 1 and second.completed == 1
+    assert first.in_flight == second.in_flight == 0
+
+
+def test_transcribe_segment_does_not_sleep_after_the_last_attempt(clock, monkeypatch):
+    retries = 3
+    sharding = make_coordinator(1, retries=retries, failure_threshold=10)
+    sleeps = []
+    monkeypatch.setattr(coordinator, "sleep", sleeps.append)
+
+    def request_transcription(backend, waveform):
+        raise ConnectionError("refused")
+
+    monkeypatch.setattr(sharding, "request_transcription", request_transcription)
+
+    with pytest.raises(RuntimeError):
+        sharding.transcribe_segment(None)
+
+    assert sleeps == [0.5, 1.0]
+    assert sharding.backends[0].failures == retries
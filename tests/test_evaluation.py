@@ -0,0 +1,131 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+pytest.importorskip("librosa")
+pytest.importorskip("gradio")
+
+from asr_inference_service.evaluation import (  # noqa: E402
+    attribute_zoom_names,
+    diarization_error,
+    diarization_time_saved,
+    pareto_front,
+    read_rttm,
+    word_errors,
+)
+
+ZOOM_TRANSCRIPT = """WEBVTT
+
+1
+00:00:01.000 --> 00:00:04.000
+Alice: Thanks for joining us today.
+
+2
+00:00:06.000 --> 00:00:09.000
+Bob: Happy to be here.
+"""
+
+
+def test_word_errors():
+    reference = "the cat sat on the mat".split()
+
+    assert word_errors(reference, reference) == 0
+    # Substitution, deletion and insertions
+    assert word_errors(reference, "the cat sat on a mat".split()) == 1
+    assert word_errors(reference, "the cat sat on mat".split()) == 1
+    assert word_errors(["a", "b"], ["x", "a", "b", "y"]) == len(["x", "y"])
+    assert word_errors(reference, []) == len(reference)
+    assert word_errors([], ["a"]) == 1
+
+
+def test_diarization_error_maps_speakers_one_to_one():
+    reference = [(0.0, 10.0, "Alice"), (10.0, 20.0, "Bob")]
+
+    errors = diarization_error(reference, [(0.0, 10.0, "SPEAKER_01"), (10.0, 20.0, "SPEAKER_00")])
+    assert errors == pytest.approx({"missed": 0.0, "false_alarm": 0.0, "confusion": 0.0, "total": 20.0})
+
+    # One hypothesis speaker for both, only one of them can be mapped
+    errors = diarization_error(reference, [(0.0, 20.0, "SPEAKER_00")])
+    assert errors == pytest.approx({"missed": 0.0, "false_alarm": 0.0, "confusion": 10.0, "total": 20.0})
+
+
+def test_diarization_error_missed_and_false_alarm():
+    reference = [(0.0, 10.0, "Alice")]
+
+    assert diarization_error(reference, [(0.0, 5.0, "SPEAKER_00")]) == pytest.approx(
+        {"missed": 5.0, "false_alarm": 0.0, "confusion": 0.0, "total": 10.0}
+    )
+    assert diarization_error(reference, [(0.0, 12.0, "SPEAKER_00")]) == pytest.approx(
+        {"missed": 0.0, "false_alarm": 2.0, "confusion": 0.0, "total": 10.0}
+    )
+    assert diarization_error(reference, []) == pytest.approx(
+        {"missed": 10.0, "false_alarm": 0.0, "confusion": 0.0, "total": 10.0}
+    )
+
+
+def test_read_rttm_skips_other_lines(tmp_path):
+    rttm_path = tmp_path / "interview.rttm"
+    rttm_path.write_text(
+        "SPEAKER interview 1 0.50 2.00 <NA> <NA> Alice <NA> <NA>\n"
+        "SPKR-INFO interview 1 <NA> <NA> <NA> unknown Alice <NA> <NA>\n"
+        "SPEAKER interview 1 3.00\n"
+        "SPEAKER interview 1 3.00 1.50 <NA> <NA> Bob <NA> <NA>\n",
+        encoding="utf-8",
+    )
+
+    assert read_rttm(str(rttm_path)) == [(0.5, 2.5, "Alice"), (3.0, 4.5, "Bob")]
+
+
+def test_pareto_front():
+    rows = [
+        {"config": "baseline", "rtf": 0.3, "wer": 0.10, "der": 0.12},
+        {"config": "draft", "rtf": 0.1, "wer": 0.15, "der": 0.12},
+        {"config": "archival", "rtf": 0.9, "wer": 0.08, "der": 0.12},
+        # Slower and worse than the baseline
+        {"config": "fast_diarization", "rtf": 0.3, "wer": 0.10, "der": 0.20},
+        # Ties are not dominated
+        {"config": "vad_trim", "rtf": 0.3, "wer": 0.10, "der": 0.12},
+    ]
+
+    assert pareto_front(rows) == {"baseline", "draft", "archival", "vad_trim"}
+    assert pareto_front(rows, objectives=("rtf",)) == {"draft"}
+
+
+def test_attribute_zoom_names(tmp_path):
+    zoom_path = tmp_path / "zoom.txt"
+    zoom_path.write_text(ZOOM_TRANSCRIPT, encoding="utf-8")
+    segments = [
+        (0.0, 5.0, "SPEAKER_01", "thanks for joining us today"),
+        (5.0, 10.0, "SPEAKER_00", "happy to be here"),
+        # No Zoom utterance falls in this one, the label is kept
+        (20.0, 22.0, "SPEAKER_02", "bye"),
+        # Zoom-aligned segments already carry the names
+        (30.0, 32.0, "Bob", "see you"),
+    ]
+
+    assert attribute_zoom_names(segments, str(zoom_path)) == [
+        (0.0, 5.0, "Alice", "thanks for joining us today"),
+        (5.0, 10.0, "Bob", "happy to be here"),
+        (20.0, 22.0, "SPEAKER_02", "bye"),
+        (30.0, 32.0, "Bob", "see you"),
+    ]
+
+
+def test_diarization_time_saved():
+    rows = [
+        {"config": "baseline", "diarization_time": 10.0, "trimmed_fraction": 0.0,
+         "items": [{"id": "a", "diarization_time": 6.0}, {"id": "b", "diarization_time": 4.0}]},
+        {"config": "vad_trim", "diarization_time": 6.0, "trimmed_fraction": 0.5,
+         "items": [{"id": "a", "diarization_time": 3.0}, {"id": "b", "diarization_time": 3.0}]},
+        # Zoom-aligned runs do not diarize
+        {"config": "zoom_aligned", "diarization_time": 0.0, "trimmed_fraction": 0.0,
+         "items": [{"id": "a", "diarization_time": 0.0}]},
+    ]
+
+    diarization_time_saved(rows)
+
+    assert rows[0]["diarization_time_saved"] == pytest.approx(0.0)
+    assert rows[1]["diarization_time_saved"] == pytest.approx(0.4)
+    assert [item["diarization_time_saved"] for item in rows[1]["items"]] == pytest.approx([0.5, 0.25])
+    assert rows[2]["diarization_time_saved"] is None
+    assert rows[2]["items"][0]["diarization_time_saved"] is None
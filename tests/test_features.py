@@ -0,0 +1,53 @@
+"""Sliced whole-recording features against per-segment WhisperFeatureExtractor output"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("librosa")
+transformers = pytest.importorskip("transformers")
+
+from asr_inference_service.features import RecordingLogMel  # noqa: E402
+
+SAMPLE_RATE = 16000
+# Frames at each segment edge see neighbouring audio instead of padding and are left out
+BOUNDARY_FRAMES = 2
+# float32 torch STFT against the extractor's float64 numpy STFT, on the normalised scale
+TOLERANCE = 1e-3
+
+
+@pytest.mark.parametrize("n_mels", [80, 128])
+def test_sliced_features_match_per_segment_extraction(n_mels):
+    rng = np.random.default_rng(0)
+    feature_extractor = transformers.WhisperFeatureExtractor(feature_size=n_mels)
+    # Noise with a slow loudness envelope, every frame stays within 8 log10 units of the max
+    seconds = np.arange(60 * SAMPLE_RATE) / SAMPLE_RATE
+    envelope = 0.5 + 0.4 * np.sin(2 * np.pi * seconds / 7)
+    waveform = (0.1 * envelope * rng.standard_normal(len(seconds))).astype(np.float32)
+
+    # Random bounds that are not multiples of the hop length, up to 30s long
+    starts = rng.integers(0, len(waveform) - 2 * SAMPLE_RATE, size=16)
+    lengths = rng.integers(SAMPLE_RATE // 2, 30 * SAMPLE_RATE - SAMPLE_RATE // 10, size=16)
+    bounds = [(int(start), int(min(start + length, len(waveform)))) for start, length in zip(starts, lengths)]
+
+    recording = RecordingLogMel(feature_extractor, waveform, chunk_seconds=13.0)
+    snapped = recording.snap_bounds(bounds)
+
+    hop_length = feature_extractor.hop_length
+    assert all(start % hop_length == 0 and end % hop_length == 0 for start, end in snapped)
+    assert all(
+        abs(start - snapped_start) <= hop_length // 2 and abs(end - snapped_end) <= hop_length // 2
+        for (start, end), (snapped_start, snapped_end) in zip(bounds, snapped)
+    )
+
+    sliced = recording.batch_features(snapped)["input_features"].numpy()
+    reference = feature_extractor(
+        [waveform[start:end] for start, end in snapped], sampling_rate=SAMPLE_RATE, return_tensors="np"
+    )["input_features"]
+
+    assert sliced.shape == reference.shape
+    for idx, (start, end) in enumerate(snapped):
+        n_frames = (end - start) // hop_length
+        interior = np.abs(sliced[idx] - reference[idx])[:, BOUNDARY_FRAMES:n_frames - BOUNDARY_FRAMES]
+
+        assert interior.max() < TOLERANCE, f"segment {idx} ({start}, {end})"
@@ -0,0 +1,58 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from asr_inference_service.generation import GenerationGuard  # noqa: E402
+
+
+def run_guard(guard: GenerationGuard, rows: list) -> torch.Tensor:
+    """Call the guard once per generated token like generate does, prompt of one token"""
+    input_ids = torch.tensor(rows)
+    stopped = None
+
+    for length in range(2, input_ids.shape[1] + 1):
+        stopped = guard(input_ids[:, :length], None)
+
+    return stopped
+
+
+def test_repetition_hits_count_inputs_not_beams():
+    looping, fine = [0] + [7, 8] * 8, [0] + list(range(10, 26))
+    # Two inputs with three beams each, every beam of the first input loops
+    guard = GenerationGuard(max_new_tokens=100, max_repeats=4, num_beams=3)
+    stopped = run_guard(guard, [looping, looping, looping, fine, fine, fine])
+
+    assert stopped.tolist() == [True, True, True, False, False, False]
+    assert guard.repetition_hits == {0}
+    assert guard.budget_hits == set()
+
+
+def test_short_ngrams_need_more_repeats():
+    # "yeah, yeah, yeah, yeah" is two tokens repeated four times
+    yeah = [0, 5] + [9, 3] * 4
+    guard = GenerationGuard(max_new_tokens=100, max_repeats=4, min_repeat_tokens=16)
+
+    assert run_guard(guard, [yeah]).tolist() == [False]
+    assert guard.repetition_hits == set()
+
+    # Only stopped once the loop spans min_repeat_tokens
+    guard = GenerationGuard(max_new_tokens=100, max_repeats=4, min_repeat_tokens=16)
+    assert run_guard(guard, [[0] + [9] * 15]).tolist() == [False]
+    assert run_guard(guard, [[0] + [9] * 16]).tolist() == [True]
+    assert guard.repetition_hits == {0}
+
+
+def test_long_ngrams_stop_after_max_repeats():
+    phrase = [11, 12, 13, 14, 15]
+    guard = GenerationGuard(max_new_tokens=100, max_repeats=4, min_repeat_tokens=16)
+
+    assert run_guard(guard, [[0] + phrase * 4]).tolist() == [True]
+    assert guard.repetition_hits == {0}
+
+
+def test_budget_hits_count_inputs_not_beams():
+    guard = GenerationGuard(max_new_tokens=5, num_beams=2)
+    run_guard(guard, [[0] + list(range(1, 6)), [0] + list(range(11, 16))] * 2)
+
+    assert guard.budget_hits == {0, 1}
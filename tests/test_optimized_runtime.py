@@ -0,0 +1,93 @@
+"""
+Eager vs compiled Whisper, needs a GPU and a local checkpoint in PRETRAINED_MODEL_DIR:
+    PRETRAINED_MODEL_DIR=/path/to/whisper-large-v3 pytest tests/test_optimized_runtime.py -s
+"""
+
+import copy
+import logging
+import os
+from time import perf_counter
+
+import pytest
+
+torch = pytest.importorskip("torch")
+np = pytest.importorskip("numpy")
+transformers = pytest.importorskip("transformers")
+
+from asr_inference_service.runtime import compile_whisper  # noqa: E402
+
+MODEL_DIR = os.environ.get("PRETRAINED_MODEL_DIR")
+
+pytestmark = [
+    pytest.mark.skipif(not torch.cuda.is_available(), reason="needs a GPU"),
+    pytest.mark.skipif(
+        not MODEL_DIR or not os.path.isdir(MODEL_DIR), reason="PRETRAINED_MODEL_DIR not set"
+    ),
+]
+
+SAMPLE_RATE = 16000
+
+
+def speech_like_batch(batch_size: int, duration: float) -> list:
+    """Amplitude modulated harmonics, different per row so the rows decode differently"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    batch = []
+
+    for _ in range(batch_size):
+        pitch = rng.uniform(100, 220)
+        voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+        envelope = 0.5 * (1 + np.sin(2 * np.pi * rng.uniform(2, 5) * t))
+        batch.append((0.1 * voiced * envelope).astype(np.float32))
+
+    return batch
+
+
+def timed_generate(model, input_features, runs: int = 3, **generate_kwargs):
+    """Greedy/beam decode, returns the token ids and the mean latency over runs"""
+    torch.cuda.synchronize()
+    start = perf_counter()
+
+    for _ in range(runs):
+        with torch.inference_mode():
+            tokens = model.generate(input_features, **generate_kwargs)
+
+    torch.cuda.synchronize()
+
+    return tokens, (perf_counter() - start) / runs
+
+
+@pytest.mark.parametrize("batch_size,num_beams", [(1, 1), (8, 1), (1, 5)])
+def test_compiled_matches_eager(batch_size, num_beams, record_property):
+    processor = transformers.AutoProcessor.from_pretrained(MODEL_DIR)
+    eager = transformers.AutoModelForSpeechSeq2Seq.from_pretrained(MODEL_DIR).to("cuda").eval()
+    eager.generation_config.forced_decoder_ids = processor.get_decoder_prompt_ids(
+        language="english", task="transcribe"
+    )
+    compiled = copy.deepcopy(eager)
+    compile_whisper(compiled, "cuda")
+
+    input_features = processor(
+        speech_like_batch(batch_size, 5.0), sampling_rate=SAMPLE_RATE, return_tensors="pt"
+    )["input_features"].to("cuda")
+    generate_kwargs = {"num_beams": num_beams, "max_new_tokens": 64}
+
+    eager_tokens, eager_latency = timed_generate(eager, input_features, **generate_kwargs)
+    # the first compiled runs include compilation, time the warm graphs only
+    timed_generate(compiled, input_features, runs=2, **generate_kwargs)
+    compiled_tokens, compiled_latency = timed_generate(compiled, input_features, **generate_kwargs)
+
+    record_property("eager_latency", eager_latency)
+    record_property("compiled_latency", compiled_latency)
+    logging.info(
+        "batch %s, beams %s. Eager: %s, compiled: %s (%.2fx)",
+        batch_size,
+        num_beams,
+        eager_latency,
+        compiled_latency,
+        eager_latency / compiled_latency,
+    )
+
+    assert processor.batch_decode(compiled_tokens, skip_special_tokens=True) == processor.batch_decode(
+        eager_tokens, skip_special_tokens=True
+    )
@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+
+from asr_inference_service.uploads import (
+    MIN_CHUNK_SIZE,
+    UploadError,
+    UploadSpool,
+    chunk_ranges,
+)
+
+
+async def body(data: bytes):
+    yield data
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return UploadSpool(str(tmp_path), chunk_size=MIN_CHUNK_SIZE, max_chunk_size=4 * MIN_CHUNK_SIZE,
+                       max_total_size=100 * MIN_CHUNK_SIZE, ttl=3600)
+
+
+def test_chunk_ranges():
+    assert chunk_ranges([]) == []
+    assert chunk_ranges([0, 1, 2, 5, 7, 8]) == [[0, 2], [5, 5], [7, 8]]
+
+
+@pytest.mark.parametrize("total_size,chunk_size", [
+    (0, None),
+    (100 * MIN_CHUNK_SIZE + 1, None),
+    (MIN_CHUNK_SIZE, MIN_CHUNK_SIZE - 1),
+    (MIN_CHUNK_SIZE, 4 * MIN_CHUNK_SIZE + 1),
+])
+def test_create_rejects_sizes_out_of_bounds(spool, total_size, chunk_size):
+    with pytest.raises(UploadError):
+        spool.create("meeting.m4a", total_size, chunk_size)
+
+
+def test_status_reports_ranges_and_finalise_checks_the_file(spool):
+    data = os.urandom(5 * MIN_CHUNK_SIZE + 10)
+    upload_id = spool.create("meeting.m4a", len(data), sha256=hashlib.sha256(data).hexdigest())["upload_id"]
+
+    for index in (0, 1, 4, 5):
+        chunk = data[index * MIN_CHUNK_SIZE:(index + 1) * MIN_CHUNK_SIZE]
+        asyncio.run(spool.write_chunk(upload_id, index, body(chunk)))
+
+    status = spool.status(upload_id)
+    assert status["received_chunks"] == [[0, 1], [4, 5]]
+    assert status["missing_chunks"] == [[2, 3]]
+    assert status["prefix_bytes"] == 2 * MIN_CHUNK_SIZE
+
+    with pytest.raises(UploadError):
+        spool.finalise(upload_id)
+
+    for index in (2, 3):
+        chunk = data[index * MIN_CHUNK_SIZE:(index + 1) * MIN_CHUNK_SIZE]
+        asyncio.run(spool.write_chunk(upload_id, index, body(chunk)))
+
+    with open(spool.finalise(upload_id), "rb") as data_file:
+        assert data_file.read() == data
+
+
+def test_sweep_removes_abandoned_uploads_only(spool):
+    abandoned = spool.create("old.m4a", MIN_CHUNK_SIZE)["upload_id"]
+    active = spool.create("new.m4a", MIN_CHUNK_SIZE)["upload_id"]
+
+    stale = time.time() - 2 * spool.ttl
+    os.utime(os.path.join(spool.spool_dir, abandoned, "meta.json"), (stale, stale))
+
+    assert spool.sweep() == [abandoned]
+    assert spool.status(active)["missing_chunks"] == [[0, 0]]
+
+    with pytest.raises(UploadError):
+        spool.status(abandoned)
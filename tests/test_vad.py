@@ -0,0 +1,94 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from asr_inference_service.vad import EnergyVAD  # noqa: E402
+
+SAMPLE_RATE = 16000
+
+
+def burst(seconds: float, amplitude: float = 0.1, seed: int = 0) -> np.ndarray:
+    return (amplitude * np.random.default_rng(seed).standard_normal(int(seconds * SAMPLE_RATE))).astype(
+        np.float32
+    )
+
+
+def silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+@pytest.fixture
+def vad():
+    return EnergyVAD(threshold_db=-45.0, floor_db=-60.0, min_trim_length=2.0, padding=0.25)
+
+
+@pytest.fixture
+def waveform():
+    # 3s silence, 2.4s speech, 3.9s silence, 2.4s speech, 3s silence, all whole 30ms frames
+    return np.concatenate((silence(3), burst(2.4, seed=1), silence(3.9), burst(2.4, seed=2), silence(3)))
+
+
+def test_speech_regions_pad_inner_cuts_only(vad, waveform):
+    regions = vad.speech_regions(waveform, SAMPLE_RATE)
+    padding = int(0.25 * SAMPLE_RATE)
+
+    # Leading and trailing silence is padded on the speech side only, never past the edges
+    assert regions.tolist() == [
+        [48000 - padding, 86400 + padding],
+        [148800 - padding, 187200 + padding],
+    ]
+
+
+def test_short_silences_are_kept(vad):
+    waveform = np.concatenate((burst(2, seed=1), silence(1.5), burst(2, seed=2)))
+
+    assert vad.speech_regions(waveform, SAMPLE_RATE).tolist() == [[0, len(waveform)]]
+
+
+def test_compact_keeps_region_samples(vad, waveform):
+    regions = vad.speech_regions(waveform, SAMPLE_RATE)
+    compacted = vad.compact(waveform, regions)
+
+    assert len(compacted) == int((regions[:, 1] - regions[:, 0]).sum())
+    np.testing.assert_array_equal(compacted, np.concatenate([waveform[start:end] for start, end in regions]))
+
+
+def test_restore_timestamps_round_trip(vad, waveform):
+    regions = vad.speech_regions(waveform, SAMPLE_RATE)
+    first_length = (regions[0, 1] - regions[0, 0]) / SAMPLE_RATE
+    compacted_length = len(vad.compact(waveform, regions)) / SAMPLE_RATE
+
+    turns = [
+        (0.5, 1.0, "A"),
+        (first_length + 0.5, first_length + 1.0, "B"),
+        # Crosses the cut between the regions and is split there
+        (first_length - 0.5, first_length + 0.5, "C"),
+    ]
+    restored = vad.restore_timestamps(turns, regions, SAMPLE_RATE)
+    first_start, second_start = regions[:, 0] / SAMPLE_RATE
+    first_end = regions[0, 1] / SAMPLE_RATE
+
+    assert [speaker for _, _, speaker in restored] == ["A", "B", "C", "C"]
+    np.testing.assert_allclose(
+        [(start, end) for start, end, _ in restored],
+        [
+            (first_start + 0.5, first_start + 1.0),
+            (second_start + 0.5, second_start + 1.0),
+            (first_end - 0.5, first_end),
+            (second_start, second_start + 0.5),
+        ],
+    )
+
+    # A turn covering the whole compacted timeline restores to exactly the kept regions
+    whole = vad.restore_timestamps([(0.0, compacted_length, "A")], regions, SAMPLE_RATE)
+    np.testing.assert_allclose([(start, end) for start, end, _ in whole], regions / SAMPLE_RATE)
+
+
+def test_energy_floor_drops_quiet_recordings(vad):
+    # -80 dBFS hum without speech, the relative threshold alone keeps all of it
+    quiet = burst(10, amplitude=1e-4)
+    relative_only = EnergyVAD(threshold_db=-45.0, floor_db=-200.0, min_trim_length=2.0, padding=0.25)
+
+    assert relative_only.speech_regions(quiet, SAMPLE_RATE).tolist() == [[0, len(quiet)]]
+    assert len(vad.speech_regions(quiet, SAMPLE_RATE)) == 0
+    assert len(vad.compact(quiet, vad.speech_regions(quiet, SAMPLE_RATE))) == 0
@@ -1,11 +1,20 @@
+import io
 import logging
+import os
+import shutil
+import subprocess
+import threading
 
 import librosa
+import numpy as np
 
 logging.basicConfig(
     format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO
 )
 
+# Compressed audio and video containers are decoded with ffmpeg
+COMPRESSED_EXTENSIONS = (".m4a", ".mp4", ".mp3", ".ogg", ".opus", ".webm", ".flac", ".aac")
+
 
 def resample_audio_filepath(audio_filepath, desired_sr):
 
@@ -30,3 +39,82 @@ def resample_audio_array(y, original_sr, desired_sr):
     logging.info("Audio preprocessed, Shape : %s", y_mono.shape)
 
     return y_mono
+
+
+def decode_audio_ffmpeg(source, desired_sr, chunk_size=1 << 20):
+    """
+    Decode any audio/video container ffmpeg understands (wav, m4a, mp4, mp3, ogg, ...)
+    straight to mono float32 PCM at desired_sr, streamed through a pipe without an
+    intermediate wav file.
+
+    source is a filepath or a file object. File objects backed by a file on disk are
+    handed to ffmpeg by file descriptor so containers with the index at the end
+    (e.g. Zoom's m4a/mp4) stay seekable, other file objects are streamed over stdin.
+    """
+
+    logging.info("Audio decoding started : To %s SR", desired_sr)
+
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin"]
+    pass_fds = ()
+    stream = None
+
+    if isinstance(source, (str, os.PathLike)):
+        command += ["-i", os.fspath(source)]
+    else:
+        try:
+            fd = source.fileno()
+            source.seek(0)
+            command += ["-i", f"/dev/fd/{fd}"]
+            pass_fds = (fd,)
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            command = [arg for arg in command if arg != "-nostdin"] + ["-i", "pipe:0"]
+            stream = source
+
+    command += ["-vn", "-f", "f32le", "-acodec", "pcm_f32le", "-ac", "1", "-ar", str(desired_sr), "pipe:1"]
+
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE if stream is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        pass_fds=pass_fds,
+    )
+
+    def feed_stdin():
+        try:
+            shutil.copyfileobj(stream, process.stdin, chunk_size)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+
+    if stream is not None:
+        feeder = threading.Thread(target=feed_stdin, daemon=True)
+        feeder.start()
+
+    # Drain stderr concurrently so ffmpeg never blocks on a full pipe
+    stderr_chunks = []
+    stderr_reader = threading.Thread(
+        target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True
+    )
+    stderr_reader.start()
+
+    pcm = bytearray()
+    while chunk := process.stdout.read(chunk_size):
+        pcm.extend(chunk)
+
+    process.wait()
+    stderr_reader.join()
+    if stream is not None:
+        feeder.join()
+
+    if process.returncode != 0:
+        raise ValueError(
+            f"ffmpeg could not decode the audio: {b''.join(stderr_chunks).decode(errors='ignore').strip()}"
+        )
+
+    y = np.frombuffer(pcm, dtype=np.float32)
+
+    logging.info("Audio decoded, Shape : %s", y.shape)
+
+    return y
@@ -11,11 +11,12 @@ logging.basicConfig(
 
 def read_txt_file(file):
     """
-    Read a txt file and return a string
+    Read a txt file (path or uploaded file object) and return a string
     """
     if file is None:
         return "No file uploaded."
-    with open(file.name, "r", encoding="utf-8") as f:
+    path = file if isinstance(file, str) else file.name
+    with open(path, "r", encoding="utf-8") as f:
         text = f.read()
     return text
 
@@ -74,6 +75,59 @@ def get_timestamps_for_speaker(file):
     return matches
 
 
+def get_zoom_cues(file):
+    """
+    Get all utterances of a Zoom transcript as [start_seconds, end_seconds, speaker]
+    """
+    return [
+        [convert_to_seconds(start), convert_to_seconds(end), speaker.strip()]
+        for start, end, speaker in get_timestamps_for_speaker(file)
+    ]
+
+
+def merge_adjacent_cues(cues, max_gap):
+    """
+    Merges consecutive cues of the same speaker that are at most max_gap seconds apart. E.g.
+
+    [[1.0, 4.0, 'Alice'], [4.5, 9.0, 'Alice'], [9.2, 12.0, 'Bob']]
+
+    TO
+
+    [[1.0, 9.0, 'Alice'], [9.2, 12.0, 'Bob']]
+    """
+    merged = []
+
+    for start, end, speaker in sorted(cues, key=lambda cue: cue[0]):
+
+        if merged and merged[-1][2] == speaker and start - merged[-1][1] <= max_gap:
+            merged[-1][1] = max(merged[-1][1], end)
+            continue
+
+        merged.append([start, end, speaker])
+
+    return merged
+
+
+def get_number_of_speakers(time_intervals, start_seconds=None, end_seconds=None):
+    """
+    Counts the distinct speakers of the Zoom transcript time intervals (from get_timestamps_for_speaker)
+    that speak between start_seconds and end_seconds, used as a hint for the diarizer
+    """
+    speakers = set()
+
+    for start, end, speaker in time_intervals:
+
+        if start_seconds is not None and convert_to_seconds(end) < start_seconds:
+            continue
+
+        if end_seconds is not None and convert_to_seconds(start) > end_seconds:
+            continue
+
+        speakers.add(speaker.strip())
+
+    return len(speakers)
+
+
 def replacement_of_string_in_text(text, old_text, replacement_text):
     """
     Replaces old_text in a string (text) with the new replacement_text using Regex